@@ -0,0 +1,113 @@
+# Throughput benchmark of SecCrawler against the local EDGAR stand-in (benchmarks/edgar_stub.py).
+# Every scenario crawls the 10-K and 10-Q filings of a few fake companies into a temporary folder,
+# with a cold response cache, and reports requests/s, bytes/s and the p50 / p99 request latency.
+#
+# usage example (from the project folder):
+#     python3 -m benchmarks.crawler_benchmark --tickers 5 --count 40 --output crawler_bench.json
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import numpy as np
+
+from tools import transport
+from tools.crawler import SecCrawler
+from benchmarks.edgar_stub import EdgarStubServer, StubConfig
+
+SCENARIOS = {
+    'no_latency': dict(latency=0.0),
+    'wan_latency': dict(latency=0.05, jitter=0.05),
+    'flaky': dict(latency=0.05, jitter=0.05, error_rate=0.05),
+    'throttled': dict(latency=0.05, throttle_rps=10),
+}
+
+
+class LatencyRecorder(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+
+    def __call__(self, response, *args, **kwargs):
+        # time between sending the request and parsing the response headers
+        with self.lock:
+            self.latencies.append(response.elapsed.total_seconds())
+
+
+def run_scenario(name, stub_config, tickers=3, count=20, doc_type='xbrl', rate=None, workers=None):
+    server = EdgarStubServer(config=stub_config)
+    base_url = server.start()
+    data_path = tempfile.mkdtemp(prefix='crawler_bench_')
+    # cold cache for every scenario, so all the requests go through the stub
+    original_cache = transport.CACHE
+    transport.CACHE = transport.ResponseCache(os.path.join(data_path, 'http_cache.sqlite'))
+    recorder = LatencyRecorder()
+    transport.SESSION.hooks['response'].append(recorder)
+    crawler_kwargs = {'edgar_base_url': base_url}
+    if rate is not None:
+        crawler_kwargs['rate_limiter'] = transport.TokenBucket(rate)
+    if workers is not None:
+        crawler_kwargs['max_workers'] = workers
+    try:
+        crawler = SecCrawler(data_path, **crawler_kwargs)
+        start = time.perf_counter()
+        for idx in range(tickers):
+            cik = str(1000 + idx)
+            crawler.filing_10K('stub%d' % idx, cik, 'Stub Company %d' % idx, '20191031', count, doc_type)
+            crawler.filing_10Q('stub%d' % idx, cik, 'Stub Company %d' % idx, '20191031', count, doc_type)
+        wall_time = time.perf_counter() - start
+    finally:
+        transport.SESSION.hooks['response'].remove(recorder)
+        transport.CACHE = original_cache
+        server.stop()
+        shutil.rmtree(data_path, ignore_errors=True)
+
+    latencies = np.array(recorder.latencies) if recorder.latencies else np.zeros(1)
+    return {'scenario': name,
+            'wall_time_s': wall_time,
+            'requests': server.stats.requests,
+            'errors': server.stats.errors,
+            'throttled': server.stats.throttled,
+            'requests_per_s': server.stats.requests / wall_time,
+            'bytes_per_s': server.stats.bytes_sent / wall_time,
+            'latency_p50_ms': 1000 * np.percentile(latencies, 50),
+            'latency_p99_ms': 1000 * np.percentile(latencies, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SecCrawler throughput benchmark (offline)')
+    parser.add_argument('--tickers', type=int, default=3, help='Number of fake companies to crawl')
+    parser.add_argument('--count', type=int, default=20, help='Number of filings per company and form')
+    parser.add_argument('--doc-type', type=str, default='xbrl', choices=['xbrl', 'txt'])
+    parser.add_argument('--doc-size', type=int, default=200 * 1024, help='Size of the documents in bytes')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='Client rate limit in requests/s (default is the sec.gov limit)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of crawler workers')
+    parser.add_argument('--scenarios', type=str, nargs='+', default=list(SCENARIOS.keys()))
+    parser.add_argument('--output', type=str, default=None, help='Save the results to a json file')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenarios:
+        stub_config = StubConfig(doc_size=args.doc_size, **SCENARIOS[name])
+        results.append(run_scenario(name, stub_config, args.tickers, args.count, args.doc_type,
+                                    args.rate, args.workers))
+
+    print()
+    print('%-12s %8s %9s %7s %9s %11s %9s %9s' % ('scenario', 'requests', 'wall[s]', 'req/s', 'MB/s',
+                                                'throttled', 'p50[ms]', 'p99[ms]'))
+    for res in results:
+        print('%-12s %8d %9.2f %7.1f %9.2f %11d %9.1f %9.1f' % (
+            res['scenario'], res['requests'], res['wall_time_s'], res['requests_per_s'],
+            res['bytes_per_s'] / 1e6, res['throttled'], res['latency_p50_ms'], res['latency_p99_ms']))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# A local stand-in for the parts of sec.gov used by SecCrawler, so the crawler can be tested and
+# benchmarked offline. It serves browse-edgar XML filing lists, filing index pages and the documents
+# themselves (xbrl / txt), either synthetic or recorded from sec.gov, with configurable latency,
+# random server errors and 429 throttling.
+#
+# usage example (from the project folder):
+#     python3 -m benchmarks.edgar_stub --port 8000 --latency 0.05 --error-rate 0.01 --throttle-rps 10
+
+import os
+import time
+import zlib
+import random
+import argparse
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from tools.transport import TokenBucket
+
+
+class StubConfig(object):
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rps=None, doc_size=200 * 1024,
+                 fixtures_dir=None, seed=0):
+        self.latency = latency  # seconds added to every response
+        self.jitter = jitter  # random extra latency, uniform in [0, jitter]
+        self.error_rate = error_rate  # fraction of requests answered with a 500
+        self.throttle_rps = throttle_rps  # requests per second above which the server answers 429
+        self.doc_size = doc_size  # size in bytes of the synthetic documents
+        self.fixtures_dir = fixtures_dir  # folder with recorded responses, mirroring the url paths
+        self.random = random.Random(seed)
+
+    def __repr__(self):
+        return "StubConfig(latency={0}, error_rate={1}, throttle_rps={2})".format(
+            self.latency, self.error_rate, self.throttle_rps)
+
+
+class StubStats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.throttled = 0
+            self.bytes_sent = 0
+
+    def add(self, status, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += size
+            if status == 429:
+                self.throttled += 1
+            elif status >= 500:
+                self.errors += 1
+
+
+def _accession_number(cik, filing_type, idx):
+    # every form type gets its own range of sequence numbers
+    sequence = zlib.crc32(filing_type.encode()) % 900 * 1000 + idx % 1000
+    return "%010d-%02d-%06d" % (int(cik), 19 - idx % 20, sequence)
+
+
+def synthetic_filing_list(host, cik, filing_type, count, start=0):
+    filings = []
+    for idx in range(start, start + count):
+        accession = _accession_number(cik, filing_type, idx)
+        href = "%s/Archives/edgar/data/%d/%s/%s-index.htm" % (host, int(cik), accession.replace('-', ''), accession)
+        date_filed = date(2019, 10, 31) - timedelta(days=91 * idx)
+        filings.append("<filing><dateFiled>%s</dateFiled><filingHREF>%s</filingHREF><type>%s</type></filing>" % (
+            date_filed.isoformat(), href, filing_type))
+    return ('<?xml version="1.0" encoding="ISO-8859-1" ?><companyFilings><companyInfo><CIK>%010d</CIK>'
+            '</companyInfo><results>%s</results></companyFilings>' % (int(cik), ''.join(filings)))
+
+
+def synthetic_index_page(accession_folder):
+    doc_name = "stub-%s.xml" % accession_folder[-8:]
+    return ('<html><body><table class="tableFile">'
+            '<tr><td><a href="%s">%s</a></td></tr>'
+            '<tr><td><a href="R1.htm">R1.htm</a></td></tr>'
+            '</table></body></html>' % (doc_name, doc_name))
+
+
+def synthetic_document(size):
+    fact = '<us-gaap:Revenues contextRef="FD2019Q4YTD" unitRef="usd" decimals="-6">260174000000</us-gaap:Revenues>\n'
+    body = fact * (size // len(fact) + 1)
+    return ('<?xml version="1.0" encoding="utf-8"?>\n<xbrl>\n' + body[:size] + '</xbrl>\n')
+
+
+class EdgarStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='text/html'):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stats.add(status, len(body))
+
+    def _fixture(self, *path_parts):
+        config = self.server.config
+        if config.fixtures_dir is None:
+            return None
+        path = os.path.join(config.fixtures_dir, *path_parts)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def do_GET(self):
+        config = self.server.config
+        delay = config.latency + config.random.uniform(0, config.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.server.throttle is not None and not self.server.throttle.try_acquire():
+            return self._send(429, 'Request rate threshold exceeded')
+        if config.random.random() < config.error_rate:
+            return self._send(500, 'Internal server error')
+
+        url = urlparse(self.path)
+        host = "http://%s:%d" % self.server.server_address[:2]
+        parts = [part for part in url.path.split('/') if part]
+        if url.path == '/cgi-bin/browse-edgar':
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            cik, filing_type = query.get('CIK', '0'), query.get('type', '10-K')
+            body = self._fixture('browse-edgar', '%s-%s.xml' % (cik, filing_type))
+            if body is None:
+                body = synthetic_filing_list(host, cik, filing_type, int(query.get('count', 40)),
+                                             int(query.get('start', 0)))
+            return self._send(200, body, 'application/xml')
+        if len(parts) >= 5 and parts[0] == 'Archives':
+            body = self._fixture(*parts)
+            if body is not None:
+                return self._send(200, body)
+            if parts[-1].endswith('-index.htm'):
+                return self._send(200, synthetic_index_page(parts[-2]))
+            if parts[-1].endswith('.xml') or parts[-1].endswith('.txt'):
+                return self._send(200, synthetic_document(config.doc_size), 'text/xml')
+        self._send(404, 'Not found')
+
+
+class RequestThrottle(TokenBucket):
+    '''
+    non blocking version of the token bucket, used by the server to decide when to answer 429
+    '''
+
+    def try_acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class EdgarStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, config=None):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), EdgarStubHandler)
+        self.config = config or StubConfig()
+        self.stats = StubStats()
+        self.throttle = None
+        if self.config.throttle_rps is not None:
+            self.throttle = RequestThrottle(self.config.throttle_rps)
+
+    @property
+    def url(self):
+        return "http://%s:%d" % self.server_address[:2]
+
+    def start(self):
+        '''
+        serve in a background thread, returns the base url to give to SecCrawler(edgar_base_url=...)
+        '''
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local stand-in for the sec.gov EDGAR endpoints')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency of every response in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--throttle-rps', type=float, default=None, help='Answer 429 above this request rate')
+    parser.add_argument('--doc-size', type=int, default=200 * 1024, help='Size of synthetic documents in bytes')
+    parser.add_argument('--fixtures', type=str, default=None, help='Folder with recorded responses')
+    args = parser.parse_args()
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.throttle_rps, args.doc_size, args.fixtures)
+    server = EdgarStubServer(args.port, config)
+    print("EDGAR stub listening on %s" % server.url)
+    server.serve_forever()
@@ -0,0 +1,127 @@
+# Benchmark of the XBRL parser (tools/xbrl_parser.py) on synthetic instances (benchmarks/xbrl_generator.py).
+# For every document size and engine it times load_YTD_xbrl_file and load_10Q_xbrl_file on a single file and
+# load_many on a history of files (in process and with the process pool), and reports the wall time, the peak RSS
+# and the parsed facts/s. Every case runs in a fresh process (so the peak RSS is the one of the case), with the
+# parsed-filing cache disabled. The results can be saved to a json file and compared between versions.
+#
+# usage example (from the project folder):
+#     python3 -m benchmarks.parser_benchmark --sizes small medium --years 10 --output parser_bench.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from datetime import datetime
+
+from tools.parsed_cache import PARSER_VERSION
+from benchmarks.xbrl_generator import generate_history
+
+SIZES = {
+    'small': dict(facts=500, dimensional_contexts=10),
+    'medium': dict(facts=5000, dimensional_contexts=100),
+    'large': dict(facts=50000, dimensional_contexts=1000),
+}
+CASES = ['load_YTD_xbrl_file', 'load_10Q_xbrl_file', 'load_many', 'load_many_parallel']
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS. the process pool workers of load_many are
+    # children of the case process, their peak is counted too
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def _run_case(case, engine, files_10k, files_10q, workers):
+    # runs in a fresh process
+    from tools.xbrl_parser import XBRL
+    xbrl = XBRL(use_dei=True, engine=engine, use_cache=False)
+    # the interpreter and the imported packages, before parsing anything
+    baseline_rss = _peak_rss_mb()
+    start = time.perf_counter()
+    if case == 'load_YTD_xbrl_file':
+        xbrl.load_YTD_xbrl_file(files_10k[-1])
+    elif case == 'load_10Q_xbrl_file':
+        xbrl.load_10Q_xbrl_file(files_10q[-1])
+    elif case == 'load_many':
+        xbrl.load_many(files_10k, kind='YTD', workers=1)
+    else:
+        xbrl.load_many(files_10k, kind='YTD', workers=workers or os.cpu_count())
+    xbrl.get_data_df()
+    return time.perf_counter() - start, _peak_rss_mb(), baseline_rss
+
+
+def run_size(name, size_config, years=10, engines=('soup', 'lxml'), cases=CASES, workers=None, repeat=1):
+    folder = tempfile.mkdtemp(prefix='parser_bench_')
+    try:
+        history_10k = generate_history(os.path.join(folder, '10-K'), years, form='10-K', **size_config)
+        history_10q = generate_history(os.path.join(folder, '10-Q'), 1, form='10-Q', **size_config)
+        files_10k = [path for path, _ in history_10k]
+        files_10q = [path for path, _ in history_10q]
+        facts = {'load_YTD_xbrl_file': history_10k[-1][1], 'load_10Q_xbrl_file': history_10q[-1][1],
+                 'load_many': sum(n_facts for _, n_facts in history_10k)}
+        facts['load_many_parallel'] = facts['load_many']
+        n_files = {'load_YTD_xbrl_file': 1, 'load_10Q_xbrl_file': 1, 'load_many': len(files_10k),
+                   'load_many_parallel': len(files_10k)}
+        file_size = os.path.getsize(files_10k[-1])
+
+        results = []
+        context = multiprocessing.get_context('spawn')
+        for engine in engines:
+            for case in cases:
+                wall_times, peak_rss, baseline_rss = [], 0.0, 0.0
+                for _ in range(repeat):
+                    with context.Pool(1) as pool:
+                        wall_time, rss, baseline = pool.apply(_run_case, (case, engine, files_10k, files_10q,
+                                                                          workers))
+                    wall_times.append(wall_time)
+                    peak_rss, baseline_rss = max(peak_rss, rss), max(baseline_rss, baseline)
+                wall_time = min(wall_times)
+                results.append({'size': name, 'engine': engine, 'case': case,
+                                'files': n_files[case], 'facts': facts[case], 'file_size_kb': file_size / 1024.0,
+                                'wall_time_s': wall_time, 'peak_rss_mb': peak_rss,
+                                'baseline_rss_mb': baseline_rss,
+                                'facts_per_s': facts[case] / wall_time})
+        return results
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XBRL parser benchmark on synthetic instances')
+    parser.add_argument('--sizes', type=str, nargs='+', default=['small', 'medium'], choices=list(SIZES.keys()))
+    parser.add_argument('--engines', type=str, nargs='+', default=['soup', 'lxml'], choices=['soup', 'lxml'])
+    parser.add_argument('--cases', type=str, nargs='+', default=CASES, choices=CASES)
+    parser.add_argument('--years', type=int, default=10, help='Number of files of the multi-file cases')
+    parser.add_argument('--workers', type=int, default=None, help='Workers of the parallel load_many case')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs of every case, the fastest is reported')
+    parser.add_argument('--output', type=str, default=None, help='Save the results to a json file')
+    args = parser.parse_args()
+
+    results = []
+    for name in args.sizes:
+        results += run_size(name, SIZES[name], args.years, args.engines, args.cases, args.workers, args.repeat)
+
+    print()
+    print('%-7s %-6s %-19s %6s %8s %9s %9s %11s %11s' % ('size', 'engine', 'case', 'files', 'facts', 'wall[s]',
+                                                           'rss[MB]', 'growth[MB]', 'facts/s'))
+    for res in results:
+        print('%-7s %-6s %-19s %6d %8d %9.3f %9.1f %11.1f %11.0f' % (
+            res['size'], res['engine'], res['case'], res['files'], res['facts'], res['wall_time_s'],
+            res['peak_rss_mb'], res['peak_rss_mb'] - res['baseline_rss_mb'], res['facts_per_s']))
+    if args.output is not None:
+        report = {'date': datetime.now().isoformat(), 'parser_version': PARSER_VERSION,
+                  'python': platform.python_version(), 'platform': platform.platform(),
+                  'years': args.years, 'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
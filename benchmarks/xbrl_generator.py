@@ -0,0 +1,212 @@
+# Generator of synthetic but realistic XBRL instance documents, used to benchmark tools/xbrl_parser.py.
+# A generated instance looks like a real 10-K / 10-Q instance: an xbrli:xbrl root with the usual namespaces,
+# the dei cover page facts, plain YTD / quarter / instant contexts for the current and prior years,
+# dimensional (segment) copies of them, the configured fields of config/xbrl_config.py (some of them under one
+# of their alternative names) and filler facts of other concepts, up to the requested number of facts.
+#
+# usage example (from the project folder):
+#     python3 -m benchmarks.xbrl_generator --output-dir /tmp/xbrl --years 10 --facts 5000 --dimensional-contexts 200
+
+import os
+import zlib
+import random
+import argparse
+from datetime import date, timedelta
+
+from config.xbrl_config import US_GAPP_TAGS_LIST, ALTERNATIVE_TAG_NAMES, INSTANT_TAGS
+
+HEADER = ('<?xml version="1.0" encoding="utf-8"?>\n'
+          '<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance" '
+          'xmlns:us-gaap="http://fasb.org/us-gaap/2019-01-31" xmlns:dei="http://xbrl.sec.gov/dei/2019-01-31" '
+          'xmlns:xbrldi="http://xbrl.org/2006/xbrldi" xmlns:iso4217="http://www.xbrl.org/2003/iso4217" '
+          'xmlns:stub="http://www.example.com/20190928">\n'
+          '<xbrli:unit id="usd"><xbrli:measure>iso4217:USD</xbrli:measure></xbrli:unit>\n'
+          '<xbrli:unit id="shares"><xbrli:measure>xbrli:shares</xbrli:measure></xbrli:unit>\n'
+          '<xbrli:unit id="pure"><xbrli:measure>xbrli:pure</xbrli:measure></xbrli:unit>\n'
+          '<xbrli:unit id="usdPerShare"><xbrli:divide><xbrli:unitNumerator><xbrli:measure>iso4217:USD'
+          '</xbrli:measure></xbrli:unitNumerator><xbrli:unitDenominator><xbrli:measure>xbrli:shares</xbrli:measure>'
+          '</xbrli:unitDenominator></xbrli:divide></xbrli:unit>\n')
+FOOTER = '</xbrli:xbrl>\n'
+CIK = '0000320193'
+FISCAL_YEAR_END = (9, 28)
+# years of the balance sheet (instants) of a 10-K, the other statements have 3 years of periods
+INSTANT_YEARS = 2
+FIELD_UNITS = {'EarningsPerShareDiluted': 'usdPerShare', 'EarningsPerShareBasic': 'usdPerShare', 'TaxRate': 'pure',
+               'NumberOfDilutedShares': 'shares', 'NumberOfShares': 'shares'}
+# config fields which are not us-gaap concepts themselves, they are always reported under an alternative name
+NON_GAAP_FIELDS = {'CapitalExpenditure', 'CashFlowFromOperations', 'Cash', 'TaxRate', 'NumberOfDilutedShares',
+                   'NumberOfShares', 'CurrentDebt'}
+SEGMENTS = ['AmericasSegmentMember', 'EuropeSegmentMember', 'GreaterChinaSegmentMember', 'JapanSegmentMember',
+            'RestOfAsiaPacificSegmentMember', 'IPhoneMember', 'MacMember', 'IPadMember', 'ServicesMember']
+
+
+def _context(context_id, start=None, end=None, instant=None, member=None):
+    segment = ''
+    if member is not None:
+        segment = ('<xbrli:segment><xbrldi:explicitMember dimension="us-gaap:StatementBusinessSegmentsAxis">'
+                   'stub:%s</xbrldi:explicitMember></xbrli:segment>' % member)
+    if instant is not None:
+        period = '<xbrli:instant>%s</xbrli:instant>' % instant.isoformat()
+    else:
+        period = '<xbrli:startDate>%s</xbrli:startDate><xbrli:endDate>%s</xbrli:endDate>' % (start.isoformat(),
+                                                                                            end.isoformat())
+    return ('<xbrli:context id="%s"><xbrli:entity><xbrli:identifier scheme="http://www.sec.gov/CIK">%s'
+            '</xbrli:identifier>%s</xbrli:entity><xbrli:period>%s</xbrli:period></xbrli:context>\n' % (
+                context_id, CIK, segment, period))
+
+
+def _fact(concept, context_id, unit, value, decimals='-6'):
+    return '<%s contextRef="%s" unitRef="%s" decimals="%s">%s</%s>\n' % (concept, context_id, unit, decimals,
+                                                                      value, concept)
+
+
+def _concept_name(field, rnd, alias_ratio):
+    alternatives = ALTERNATIVE_TAG_NAMES.get(field, [])
+    if type(alternatives) is not list:
+        alternatives = [alternatives]
+    if len(alternatives) > 0 and (field in NON_GAAP_FIELDS or rnd.random() < alias_ratio):
+        return 'us-gaap:' + rnd.choice(alternatives)
+    return 'us-gaap:' + field
+
+
+def _value(field, rnd):
+    if field.startswith('EarningsPerShare'):
+        return '%.2f' % rnd.uniform(0.5, 15), '2'
+    if field == 'TaxRate':
+        return '%.3f' % rnd.uniform(0.1, 0.35), '3'
+    return str(rnd.randint(1, 300000) * 1000000), '-6'
+
+
+def generate_instance(path, fiscal_year=2019, form='10-K', dimensional_contexts=20, facts=1000, alias_ratio=0.3,
+                      seed=0):
+    '''
+    write a synthetic instance document of the given fiscal year to path.
+    form - '10-K' (yearly periods of the last 3 years, balance sheet of the last 2) or '10-Q' (third quarter, with the quarter and year to date)
+    dimensional_contexts - number of contexts with a segment (facts are split between them)
+    facts - total number of facts in the document (at least the configured fields are always written)
+    alias_ratio - fraction of the fields reported under one of their alternative tag names
+    returns the number of facts written
+    '''
+    rnd = random.Random(seed * 10000 + fiscal_year)
+    month, day = FISCAL_YEAR_END
+    contexts, period_contexts, instant_contexts = [], [], []
+    if form == '10-K':
+        years = range(fiscal_year - 2, fiscal_year + 1)
+        for year in years:
+            start, end = date(year - 1, month, day + 1), date(year, month, day)
+            contexts.append(_context('FD%dQ4YTD' % year, start, end))
+            period_contexts.append(('FD%dQ4YTD' % year, start, end))
+            if year > fiscal_year - INSTANT_YEARS:
+                # the balance sheet has only the end of the current and the previous year
+                contexts.append(_context('FI%dQ4' % year, instant=end))
+                instant_contexts.append(('FI%dQ4' % year, end))
+        document_end = date(fiscal_year, month, day)
+    else:
+        for year in (fiscal_year - 1, fiscal_year):
+            ytd_start = date(year - 1, month, day + 1)
+            quarter_start, quarter_end = date(year, 3, 31), date(year, 6, 29)
+            contexts.append(_context('FD%dQ3QTD' % year, quarter_start, quarter_end))
+            period_contexts.append(('FD%dQ3QTD' % year, quarter_start, quarter_end))
+            contexts.append(_context('FD%dQ3YTD' % year, ytd_start, quarter_end))
+            period_contexts.append(('FD%dQ3YTD' % year, ytd_start, quarter_end))
+            contexts.append(_context('FI%dQ3' % year, instant=quarter_end))
+            instant_contexts.append(('FI%dQ3' % year, quarter_end))
+        document_end = quarter_end
+    # the shares outstanding on the cover page are counted a few weeks after the end of the period
+    cover_date = document_end + timedelta(days=20)
+    contexts.append(_context('I%s' % cover_date.strftime('%Y%m%d'), instant=cover_date))
+
+    dimensional_periods, dimensional_instants = [], []
+    for idx in range(dimensional_contexts):
+        member = SEGMENTS[idx % len(SEGMENTS)] + ('' if idx < len(SEGMENTS) else str(idx // len(SEGMENTS)))
+        if idx % 2 == 0:
+            context_id, start, end = period_contexts[idx // 2 % len(period_contexts)]
+            context_id = '%s_us-gaap_StatementBusinessSegmentsAxis_stub_%s' % (context_id, member)
+            contexts.append(_context(context_id, start, end, member=member))
+            dimensional_periods.append(context_id)
+        else:
+            context_id, instant = instant_contexts[idx // 2 % len(instant_contexts)]
+            context_id = '%s_us-gaap_StatementBusinessSegmentsAxis_stub_%s' % (context_id, member)
+            contexts.append(_context(context_id, instant=instant, member=member))
+            dimensional_instants.append(context_id)
+
+    body = [_fact('dei:EntityCommonStockSharesOutstanding', 'I%s' % cover_date.strftime('%Y%m%d'), 'shares',
+                  rnd.randint(1000, 9000) * 1000000, '-3'),
+            '<dei:DocumentType contextRef="%s">%s</dei:DocumentType>\n' % (period_contexts[-1][0], form),
+            '<dei:DocumentPeriodEndDate contextRef="%s">%s</dei:DocumentPeriodEndDate>\n' % (
+                period_contexts[-1][0], document_end.isoformat()),
+            '<dei:DocumentFiscalYearFocus contextRef="%s">%d</dei:DocumentFiscalYearFocus>\n' % (
+                period_contexts[-1][0], fiscal_year)]
+    n_facts = 1
+    for field in US_GAPP_TAGS_LIST:
+        # like a real company, the same concepts are used by all the filings of the history
+        concept = _concept_name(field, random.Random(zlib.crc32(('%d%s' % (seed, field)).encode())), alias_ratio)
+        unit = FIELD_UNITS.get(field, 'usd')
+        field_contexts = instant_contexts if field in INSTANT_TAGS else period_contexts
+        dimensional = dimensional_instants if field in INSTANT_TAGS else dimensional_periods
+        for context_id in [context[0] for context in field_contexts]:
+            # the comparative periods repeat the values of the filings of the previous years
+            value, decimals = _value(field, random.Random(zlib.crc32(('%d%s%s' % (seed, field, context_id)).encode())))
+            body.append(_fact(concept, context_id, unit, value, decimals))
+            n_facts += 1
+        for context_id in dimensional[:3]:
+            value, decimals = _value(field, rnd)
+            body.append(_fact(concept, context_id, unit, value, decimals))
+            n_facts += 1
+
+    # filler facts of concepts which are not configured, spread over all the contexts
+    all_periods = [context[0] for context in period_contexts] + dimensional_periods
+    all_instants = [context[0] for context in instant_contexts] + dimensional_instants
+    idx = 0
+    while n_facts < facts:
+        if idx % 3 == 0:
+            concept, context_id = 'us-gaap:OtherLiabilitiesNoncurrent%d' % (idx // 50), rnd.choice(all_instants)
+        elif idx % 3 == 1:
+            concept, context_id = 'us-gaap:OtherNonoperatingIncomeExpense%d' % (idx // 50), rnd.choice(all_periods)
+        else:
+            concept, context_id = 'stub:CustomDisclosureAmount%d' % (idx // 50), rnd.choice(all_periods)
+        body.append(_fact(concept, context_id, 'usd', rnd.randint(1, 10 ** 9)))
+        n_facts += 1
+        idx += 1
+
+    tmp_path = path + '.part'
+    with open(tmp_path, 'w') as f:
+        f.write(HEADER)
+        f.writelines(contexts)
+        f.writelines(body)
+        f.write(FOOTER)
+    os.replace(tmp_path, path)
+    return n_facts
+
+
+def generate_history(folder, years=10, last_fiscal_year=2019, form='10-K', **kwargs):
+    '''
+    write one instance per fiscal year (named like the downloaded files, e.g. stub-20190928.xml) into folder,
+    returns the list of (path, number of facts)
+    '''
+    os.makedirs(folder, exist_ok=True)
+    month, day = FISCAL_YEAR_END
+    files = []
+    for fiscal_year in range(last_fiscal_year - years + 1, last_fiscal_year + 1):
+        suffix = '%d%02d%02d' % (fiscal_year, month, day) if form == '10-K' else '%d0629' % fiscal_year
+        path = os.path.join(folder, 'stub-%s.xml' % suffix)
+        files.append((path, generate_instance(path, fiscal_year, form, **kwargs)))
+    return files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Synthetic XBRL instance generator')
+    parser.add_argument('--output-dir', type=str, required=True)
+    parser.add_argument('--years', type=int, default=10, help='Number of fiscal years (one file per year)')
+    parser.add_argument('--form', type=str, default='10-K', choices=['10-K', '10-Q'])
+    parser.add_argument('--facts', type=int, default=1000, help='Number of facts per file')
+    parser.add_argument('--dimensional-contexts', type=int, default=20, help='Number of contexts with segments')
+    parser.add_argument('--alias-ratio', type=float, default=0.3,
+                        help='Fraction of the fields reported under an alternative tag name')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    files = generate_history(args.output_dir, args.years, form=args.form, facts=args.facts,
+                             dimensional_contexts=args.dimensional_contexts, alias_ratio=args.alias_ratio,
+                             seed=args.seed)
+    for path, n_facts in files:
+        print('%s: %d facts' % (path, n_facts))
@@ -1,2 +1,3 @@
 simfin_api_key = "#########################################" # get api key from https://simfin.com
-WTD_api_key = "#########################################"
\ No newline at end of file
+WTD_api_key = "#########################################"
+sec_user_agent = "Your Name your.email@example.com" # sec.gov requires a descriptive User-Agent (name and email)
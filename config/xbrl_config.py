@@ -36,3 +36,6 @@ ALTERNATIVE_TAG_NAMES = {'Revenues': ['SalesRevenueNet', 'SalesRevenueGoodsNet',
                          'Cash': 'CashAndCashEquivalentsAtCarryingValue',
                          'NumberOfDilutedShares': ['WeightedAverageNumberOfDilutedSharesOutstanding', 'WeightedAverageNumberOfShareOutstandingBasicAndDiluted'],
                          'NumberOfShares': ['WeightedAverageNumberOfSharesOutstandingBasic', 'WeightedAverageNumberOfShareOutstandingBasicAndDiluted', 'CommonStocksIncludingAdditionalPaidInCapital']}
+
+# fields which are balance sheet values (instant contexts), all the others are reported for periods
+INSTANT_TAGS = ['StockholdersEquity', 'LongTermDebt', 'CurrentDebt', 'Cash']
@@ -3,7 +3,7 @@ import requests
 import argparse
 import pandas as pd
 import numpy as np
-from tools import utils, valuation_funcs
+from tools import utils, valuation_funcs, statement_datasets, companyfacts, monte_carlo
 from tools.xbrl_parser import XBRL
 from ipdb import set_trace
 
@@ -16,12 +16,27 @@ parser.add_argument('--foreign', '-f', action='store_true',
                     help='A boolean switch')
 parser.add_argument('--no_dei_data', '-no_dei', action='store_true',
                     help='A boolean switch')
+parser.add_argument('--datasets', type=str, nargs='+', default=None,
+                    help='Local SEC Financial Statement Data Sets zip files to take the yearly data from')
+parser.add_argument('--companyfacts', type=str, default=None,
+                    help='Local EDGAR companyfacts zip archive (or folder of json files) to take the data from')
+parser.add_argument('--monte_carlo', '-mc', action='store_true',
+                    help='Add a Monte Carlo valuation (fair value percentiles)')
 
 args = parser.parse_args()
 
 
 def load_all_historical_10K(ticker, download_latest=True, foreign=False):
     ticker = ticker.lower()
+    if args.datasets is not None:
+        forms = ('20-F',) if foreign else ('10-K',)
+        frames = statement_datasets.load_statement_datasets(args.datasets, tickers=[ticker], forms=forms,
+                                                            use_dei=not(args.no_dei_data))
+        return frames[ticker]
+    if args.companyfacts is not None:
+        forms = ('20-F',) if foreign else ('10-K',)
+        return companyfacts.load_companyfacts(ticker, args.companyfacts, kind='YTD', forms=forms,
+                                              use_dei=not(args.no_dei_data))
     if foreign:
         report_type = '20-F'
         if download_latest:
@@ -34,13 +49,15 @@ def load_all_historical_10K(ticker, download_latest=True, foreign=False):
     files = utils.get_reports_list(ticker, report_type=report_type)
     use_dei = not(args.no_dei_data)
     xbrl = XBRL(use_dei=use_dei)
-    for file in files:
-        xbrl.load_YTD_xbrl_file(file)
+    # every 10-K holds a few years, only the filings needed to cover the history are parsed
+    xbrl.load_minimal(files)
     return xbrl.get_data_df()
 
 
 def load_latest_quarters(ticker, download_latest=True, foreign=False):
     ticker = ticker.lower()
+    if args.companyfacts is not None:
+        return companyfacts.load_companyfacts(ticker, args.companyfacts, kind='10Q')
     if download_latest:
         utils.find_and_save_10Q_to_folder(ticker, number_of_documents=5)
     files_10q = utils.get_reports_list(ticker, report_type='10-Q')
@@ -49,10 +66,7 @@ def load_latest_quarters(ticker, download_latest=True, foreign=False):
         return None
     files_10k = utils.get_reports_list(ticker, report_type='10-K')
     xbrl = XBRL()
-    for file in files_10k:
-        xbrl.load_10Q_xbrl_file(file)
-    for file in files_10q:
-        xbrl.load_10Q_xbrl_file(file)
+    xbrl.load_many(files_10k + files_10q, kind='10Q')
     return xbrl.get_data_df()
 
 
@@ -87,6 +101,18 @@ def calculate_key_values(data):
     return key_values
 
 
+def format_percent(value, decimals=0):
+    if value is None or np.isnan(value):
+        return None
+    return '%.*f%%' % (decimals, value)
+
+
+def format_growth(growth):
+    growth = growth.astype(object)
+    growth.loc['CAGR'] = [format_percent(cagr) for cagr in growth.loc['CAGR'].astype(np.float64)]
+    return growth
+
+
 def main():
     ticker = args.ticker
     try:
@@ -97,10 +123,9 @@ def main():
 
     data = data.iloc[1:]
     data.loc['TTM'] = get_TTM_data(ticker, args.download, args.foreign)
-    data['NumberOfDilutedSharesAdjusted'] = utils.estimate_stock_split_adjustments(
-        data['NumberOfDilutedShares'])
-    data['NumberOfSharesAdjusted'] = utils.estimate_stock_split_adjustments(
-        data['NumberOfShares'])
+    adjusted_counts = utils.estimate_stock_split_adjustments(data[['NumberOfDilutedShares', 'NumberOfShares']])
+    data['NumberOfDilutedSharesAdjusted'] = adjusted_counts['NumberOfDilutedShares']
+    data['NumberOfSharesAdjusted'] = adjusted_counts['NumberOfShares']
     data['NumberOfDilutedSharesAdjusted'].fillna(
         data['NumberOfSharesAdjusted'], inplace=True)
     data = data.iloc[-10:] # use only data from last decade
@@ -129,32 +154,34 @@ def main():
     print('-------------------------------------------------------------------------------------')
     key_values = calculate_key_values(data)
 
-    print(key_values.transpose())
+    display_key_values = key_values.astype(object)
+    display_key_values['ROIC'] = [format_percent(roic, 2) for roic in key_values['ROIC']]
+    print(display_key_values.transpose())
     print()
     print('-------------------------------------------------------------------------------------')
     print('Book Value Per Share Growth:')
     book_value_per_share_growth = valuation_funcs.calculate_cagr_of_time_series(key_values['BookValuePerShare'])
-    print(book_value_per_share_growth)
+    print(format_growth(book_value_per_share_growth))
     print()
     print('-------------------------------------------------------------------------------------')
     print('Earning Per Share (Diluted) Growth:')
     eps_growth = valuation_funcs.calculate_cagr_of_time_series(key_values['EarningPerShare(Diluted)'])
-    print(eps_growth)
+    print(format_growth(eps_growth))
     print()
     print('-------------------------------------------------------------------------------------')
     print('OI (or EBIT):')
     oi_growth = valuation_funcs.calculate_cagr_of_time_series(key_values['OI (or EBIT)'])
-    print(oi_growth)
+    print(format_growth(oi_growth))
     print()
     print('-------------------------------------------------------------------------------------')
     print('Revenue Per Share (Diluted) Growth:')
     revenue_per_share_growth = valuation_funcs.calculate_cagr_of_time_series(key_values['RevenuePerShare(Diluted)'])
-    print(revenue_per_share_growth)
+    print(format_growth(revenue_per_share_growth))
     print()
     print('-------------------------------------------------------------------------------------')
     print('Free Cash Flow Per Share (Diluted) Growth:')
     free_cash_flow_growth = valuation_funcs.calculate_cagr_of_time_series(key_values['FreeCashFlowPerShare(Diluted)'])
-    print(free_cash_flow_growth)
+    print(format_growth(free_cash_flow_growth))
     print()
     print()
     print('-------------------------------------------------------------------------------------')
@@ -163,18 +190,10 @@ def main():
     print('Value estimation with "Growth At Normalized P/E" technique:')
     print('-------------------------------------------------------------------------------------')
 
-    cagrs = revenue_per_share_growth.loc['CAGR'].values.tolist()
-    cagrs += eps_growth.loc['CAGR'].values.tolist() 
-    cagrs += oi_growth.loc['CAGR'].values.tolist() 
-    cagrs += book_value_per_share_growth.loc['CAGR'].values.tolist() 
-    cagrs += free_cash_flow_growth.loc['CAGR'].values.tolist()
-    valid_cagrs = []
-    for cagr in cagrs:
-        try:
-            cagr_value = int(cagr[:-1])
-            valid_cagrs.append(cagr_value)
-        except:
-            continue
+    cagrs = np.concatenate([growth.loc['CAGR'].values.astype(np.float64) for growth in
+                            [revenue_per_share_growth, eps_growth, oi_growth, book_value_per_share_growth,
+                             free_cash_flow_growth]])
+    valid_cagrs = cagrs[~np.isnan(cagrs)]
     try:
         # capping the default growth rate estimation in 5-15% range
         GR_default = min(max(np.mean(valid_cagrs), 5), 15)
@@ -216,17 +235,11 @@ def main():
     print()
     print('Value estimation with "Discounted Cash Flow (FCF based)" technique:')
     print('-------------------------------------------------------------------------------------')
-    FCF_cagrs = free_cash_flow_growth.loc['CAGR'].values
-    valid_cagrs = []
-    for cagr in FCF_cagrs:
-        try:
-            cagr_value = int(cagr[:-1])
-            valid_cagrs.append(cagr_value)
-        except:
-            continue
+    FCF_cagrs = free_cash_flow_growth.loc['CAGR'].values.astype(np.float64)
+    valid_FCF_cagrs = FCF_cagrs[~np.isnan(FCF_cagrs)]
     # capping the default growth rate estimation in 5-20% range
-    if len(valid_cagrs) > 0:
-        FCF_GR = min(max(np.mean(valid_cagrs), 5), 20)
+    if len(valid_FCF_cagrs) > 0:
+        FCF_GR = min(max(np.mean(valid_FCF_cagrs), 5), 20)
     else:
         FCF_GR = GR_default
     try:
@@ -240,6 +253,25 @@ def main():
     print('-------------------------------------------------------------------------------------')
     print()
     print()
+    if args.monte_carlo:
+        print('Value estimation with Monte Carlo simulation (growth and P/E fit to the history):')
+        print('-------------------------------------------------------------------------------------')
+        try:
+            pes = key_values['P/E'].values
+            prior = monte_carlo.fit_valuation_prior(valid_cagrs, pes[~np.isnan(pes)])
+            eps_ttm = key_values.loc['TTM']['EarningPerShare(Diluted)']
+            if np.isnan(eps_ttm):
+                eps_ttm = key_values.iloc[-2]['EarningPerShare(Diluted)']
+            latest_FCF = key_values['FreeCashFlowPerShare(Diluted)'].dropna().iloc[-1]
+            results = monte_carlo.monte_carlo_valuation(latest_FCF, eps_ttm, prior)
+            for method, percentiles in results.items():
+                print('%s fair value percentiles:' % method)
+                print(percentiles.round(2).to_string(index=False))
+        except:
+            print('not enough data...')
+        print('-------------------------------------------------------------------------------------')
+        print()
+        print()
 
 
 if __name__ == "__main__":
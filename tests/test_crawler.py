@@ -0,0 +1,126 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from tools import transport
+from tools import crawler as crawler_module
+from tools.crawler import SecCrawler, MANIFEST_FILE
+from benchmarks.edgar_stub import EdgarStubServer, _accession_number
+
+CIK = '1000'
+COUNT = 5
+
+
+def _doc_name(idx):
+    # the name of the xbrl document of the idx-th newest filing of the stub (see synthetic_index_page)
+    return "stub-%s.xml" % _accession_number(CIK, '10-K', idx).replace('-', '')[-8:]
+
+
+class IncrementalCrawlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = EdgarStubServer()
+        self.base_url = self.server.start()
+        self.data_path = tempfile.mkdtemp(prefix='crawler_test_')
+        self.original_cache = transport.CACHE
+        transport.CACHE = transport.ResponseCache(os.path.join(self.data_path, 'http_cache.sqlite'))
+        self.original_download = crawler_module.transport.download
+        self.crawler = SecCrawler(os.path.join(self.data_path, ''), edgar_base_url=self.base_url)
+        self.folder = os.path.join(self.data_path, 'stub', '10-K', 'xbrl')
+
+    def tearDown(self):
+        crawler_module.transport.download = self.original_download
+        transport.CACHE = self.original_cache
+        self.server.stop()
+        shutil.rmtree(self.data_path, ignore_errors=True)
+
+    def _crawl(self):
+        return self.crawler.filing_10K('stub', CIK, 'Stub Company', '20191031', COUNT, 'xbrl')
+
+    def _fail_download_of(self, doc_name):
+        original_download = self.original_download
+
+        def download(url, path, *args, **kwargs):
+            if os.path.basename(path) == doc_name:
+                raise IOError('stub failure')
+            return original_download(url, path, *args, **kwargs)
+        crawler_module.transport.download = download
+
+    def _fail_index_page_of(self, idx):
+        # the index page of the idx-th newest filing is answered with a 404 by the stub
+        accession = _accession_number(CIK, '10-K', idx)
+        original_get = self.crawler._get
+
+        def get(url, **kwargs):
+            if url.endswith(accession + '-index.htm'):
+                url = self.base_url + '/missing-index.htm'
+            return original_get(url, **kwargs)
+        self.crawler._get = get
+
+    def _manifest(self):
+        with open(os.path.join(self.folder, MANIFEST_FILE)) as f:
+            return json.load(f)
+
+    def test_failed_download_is_retried_by_the_next_crawl(self):
+        # an older filing than the newest one, the incremental walk stops before reaching it
+        failing = _doc_name(2)
+        self._fail_download_of(failing)
+        _, failed = self._crawl()
+        self.assertEqual(failed, [failing])
+        self.assertFalse(os.path.exists(os.path.join(self.folder, failing)))
+        self.assertEqual(len(self._manifest()['pending']), 1)
+        self.assertEqual(len(self._manifest()['filings']), COUNT - 1)
+
+        crawler_module.transport.download = self.original_download
+        docs, failed = self._crawl()
+        self.assertEqual([doc_name for _, doc_name in docs], [failing])
+        self.assertEqual(failed, [])
+        self.assertTrue(os.path.exists(os.path.join(self.folder, failing)))
+        manifest = self._manifest()
+        self.assertEqual(manifest['pending'], [])
+        self.assertEqual(len(manifest['filings']), COUNT)
+
+        # nothing is left to retry
+        docs, failed = self._crawl()
+        self.assertEqual(docs, [])
+
+    def test_failed_download_stays_pending_until_retrieved(self):
+        failing = _doc_name(3)
+        self._fail_download_of(failing)
+        self._crawl()
+        _, failed = self._crawl()
+        self.assertEqual(failed, [failing])
+        self.assertEqual(len(self._manifest()['pending']), 1)
+
+    def test_failed_index_page_is_retried_by_the_next_crawl(self):
+        self._fail_index_page_of(2)
+        docs, failed = self._crawl()
+        # the other filings are still downloaded
+        self.assertEqual(len(docs), COUNT - 1)
+        self.assertEqual(len(failed), 1)
+        manifest = self._manifest()
+        self.assertEqual(len(manifest['pending']), 1)
+        self.assertEqual(len(manifest['filings']), COUNT - 1)
+        self.assertTrue(all(filing['document'] is not None for filing in manifest['filings']))
+
+        del self.crawler._get
+        docs, failed = self._crawl()
+        self.assertEqual([doc_name for _, doc_name in docs], [_doc_name(2)])
+        self.assertEqual(failed, [])
+        self.assertTrue(os.path.exists(os.path.join(self.folder, _doc_name(2))))
+        self.assertEqual(self._manifest()['pending'], [])
+
+    def test_submission_without_kept_documents_is_not_dropped(self):
+        # the stub submissions have no <DOCUMENT> sections, nothing can be extracted out of them
+        self.crawler.keep_document_types = ('EX-101.INS',)
+        docs, failed = self.crawler.filing_10K('stub', CIK, 'Stub Company', '20191031', COUNT, 'txt')
+        self.assertEqual(failed, [])
+        folder = os.path.join(self.data_path, 'stub', '10-K', 'txt')
+        for _, doc_name in docs:
+            self.assertTrue(os.path.isfile(os.path.join(folder, doc_name)))
+
+
+if __name__ == '__main__':
+    unittest.main()
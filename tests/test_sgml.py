@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tools import filing_store, sgml, utils
+
+INSTANCE = b'<?xml version="1.0" encoding="utf-8"?>\n<xbrl>\n<us-gaap:Revenues>1</us-gaap:Revenues>\n</xbrl>\n'
+SUBMISSION = (b'<SEC-DOCUMENT>0000320193-19-000119.txt : 20191031\n'
+              b'<DOCUMENT>\n<TYPE>10-K\n<SEQUENCE>1\n<FILENAME>a10-k20199282019.htm\n<TEXT>\n'
+              b'<html>the report</html>\n</TEXT>\n</DOCUMENT>\n'
+              b'<DOCUMENT>\n<TYPE>GRAPHIC\n<SEQUENCE>2\n<FILENAME>g1.jpg\n<TEXT>\nbegin 644 g1.jpg\n</TEXT>\n'
+              b'</DOCUMENT>\n'
+              b'<DOCUMENT>\n<TYPE>EX-101.INS\n<SEQUENCE>3\n<FILENAME>aapl-20190928.xml\n<TEXT>\n<XBRL>\n' +
+              INSTANCE + b'</XBRL>\n</TEXT>\n</DOCUMENT>\n'
+              b'<DOCUMENT>\n<TYPE>XML\n<SEQUENCE>4\n<FILENAME>FilingSummary.xml\n<TEXT>\n<XML>\n'
+              b'<FilingSummary/>\n</XML>\n</TEXT>\n</DOCUMENT>\n'
+              b'</SEC-DOCUMENT>\n')
+SUBMISSION_NAME = '0000320193-19-000119.txt'
+
+
+class SplitSubmissionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_path = tempfile.mkdtemp(prefix='sgml_test_')
+        self.folder = os.path.join(self.data_path, 'aapl', '10-K', 'txt')
+        os.makedirs(self.folder)
+        self.submission = os.path.join(self.folder, SUBMISSION_NAME)
+        with open(self.submission, 'wb') as f:
+            f.write(SUBMISSION)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_path, ignore_errors=True)
+
+    def _check_split(self):
+        saved = sgml.split_folder(self.folder)
+        self.assertEqual(saved, [os.path.join(self.folder, 'aapl-20190928.xml')])
+        with open(saved[0], 'rb') as f:
+            self.assertEqual(f.read(), INSTANCE)
+
+    def test_split_plain(self):
+        self._check_split()
+
+    def test_split_gzip(self):
+        filing_store.store_file(self.submission, self.data_path, codec='gzip')
+        self.assertFalse(os.path.isfile(self.submission))
+        self._check_split()
+
+    @unittest.skipIf(filing_store.zstandard is None, 'the zstandard package is not installed')
+    def test_split_zstd(self):
+        filing_store.store_file(self.submission, self.data_path, codec='zstd')
+        self.assertFalse(os.path.isfile(self.submission))
+        self._check_split()
+
+    def test_submission_without_instance_is_kept(self):
+        other = os.path.join(self.folder, '0000320193-18-000145.txt')
+        with open(other, 'wb') as f:
+            f.write(SUBMISSION.replace(b'EX-101.INS', b'EX-99'))
+        sgml.split_folder(self.folder, remove_submissions=True)
+        self.assertFalse(os.path.isfile(self.submission))
+        self.assertTrue(os.path.isfile(other))
+
+    def test_reports_list_lists_every_filing_once(self):
+        sgml.split_folder(self.folder)
+        submissions = utils.get_reports_list('aapl', file_type='txt', data_folder=self.data_path)
+        self.assertEqual(submissions, [self.submission])
+        instances = utils.get_reports_list('aapl', file_type='txt', data_folder=self.data_path, extracted=True)
+        self.assertEqual(instances, [os.path.join(self.folder, 'aapl-20190928.xml')])
+
+
+if __name__ == '__main__':
+    unittest.main()
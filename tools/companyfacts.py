@@ -0,0 +1,124 @@
+# Loader of the EDGAR companyfacts JSON documents (https://data.sec.gov/api/xbrl/companyfacts/CIK##########.json),
+# either single files or the nightly bulk archive (companyfacts.zip), which is read without extracting it.
+# A companyfacts document already holds every non dimensional fact a company ever reported, with the filing it
+# was reported in, so a whole decade of data is one small JSON instead of a stack of XBRL instances.
+# The facts are mapped to the fields of config/xbrl_config.py and selected with the same rules as the
+# Financial Statement Data Sets loader (tools/statement_datasets.py), giving the frames of XBRL.get_data_df().
+# Every document is read whole (a company's document is a few MB at most) and decoded with the optional orjson
+# package when it is installed, or with the standard json module otherwise.
+#
+# usage example:
+#     data = load_companyfacts('aapl', 'SEC-Edgar-Data/companyfacts.zip', kind='YTD')
+
+import os
+import json
+import zipfile
+from datetime import date
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from tools import utils, statement_datasets
+from tools.xbrl_parser import build_alias_map
+from config.xbrl_config import US_GAPP_TAGS_LIST, ALTERNATIVE_TAG_NAMES
+
+DEFAULT_COMPANYFACTS_PATH = os.path.join(os.getcwd(), 'SEC-Edgar-Data', 'companyfacts.zip')
+COMPANYFACTS_FILE = 'CIK%010d.json'
+
+
+def _loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def read_companyfacts(cik, path=DEFAULT_COMPANYFACTS_PATH):
+    '''
+    the companyfacts document of a company. path is either the bulk zip archive, a folder of
+    CIK##########.json files or a single json file
+    '''
+    file_name = COMPANYFACTS_FILE % int(cik)
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            return _loads(zf.read(file_name))
+    if os.path.isdir(path):
+        path = os.path.join(path, file_name)
+    with open(path, 'rb') as f:
+        return _loads(f.read())
+
+
+def _flatten_facts(companyfacts, alias_map, forms):
+    '''
+    the facts of the document which can fill one of the fields, as a table like the one of the
+    statement_datasets loader, and the table of the filings they were reported in
+    '''
+    facts, filings = [], {}
+    for tag, concept in companyfacts.get('facts', {}).get('us-gaap', {}).items():
+        aliases = alias_map.get(tag.lower())
+        if aliases is None:
+            continue
+        for items in concept.get('units', {}).values():
+            for item in items:
+                if item.get('form') not in forms:
+                    continue
+                end = item['end']
+                if 'start' in item:
+                    days = (date.fromisoformat(end) - date.fromisoformat(item['start'])).days
+                    qtrs = int(round(days / 91.25))
+                    if qtrs not in (1, 4):
+                        continue
+                else:
+                    qtrs = 0
+                ddate = int(end.replace('-', ''))
+                accn = item['accn']
+                # the period of a filing is the end of the latest period it reported
+                filings[accn] = (max(filings[accn][0], ddate) if accn in filings else ddate, item.get('fy'))
+                for field, rank in aliases:
+                    facts.append((accn, field, rank, ddate, qtrs, float(item['val'])))
+    facts = pd.DataFrame(facts, columns=statement_datasets.FACT_COLUMNS)
+    subs = pd.DataFrame([(accn, period, fy) for accn, (period, fy) in filings.items()],
+                        columns=['adsh', 'period', 'fy'])
+    subs['period'] = pd.to_datetime(subs['period'].astype(str), format='%Y%m%d')
+    subs['fy'] = subs['fy'].astype(np.float64)
+    return facts, subs
+
+
+def _dei_shares(companyfacts, subs):
+    dei = companyfacts.get('facts', {}).get('dei', {}).get(statement_datasets.DEI_SHARES_TAG, {})
+    rows = [(item['accn'], float(item['val'])) for items in dei.get('units', {}).values() for item in items]
+    dei = pd.DataFrame(rows, columns=['adsh', 'value'])
+    return dei[dei['adsh'].isin(subs['adsh'])]
+
+
+def load_companyfacts(ticker, path=DEFAULT_COMPANYFACTS_PATH, kind='YTD', forms=None, use_dei=False, extra_tags=[]):
+    '''
+    the data of a company out of its companyfacts document, like XBRL(use_dei, extra_tags).get_data_df()
+    after loading all of its 10-K filings (kind='YTD') or its 10-K and 10-Q filings (kind='10Q')
+    '''
+    if kind not in ('YTD', '10Q'):
+        raise ValueError("kind should be 'YTD' or '10Q'")
+    if forms is None:
+        forms = statement_datasets.ANNUAL_FORMS if kind == 'YTD' else statement_datasets.QUARTERLY_FORMS
+    cik, _ = utils.get_cik_and_name_from_ticker(ticker)
+    companyfacts = read_companyfacts(cik, path)
+
+    tag_names_list = US_GAPP_TAGS_LIST + list(extra_tags)
+    alias_map = build_alias_map(tag_names_list, ALTERNATIVE_TAG_NAMES)
+    facts, subs = _flatten_facts(companyfacts, alias_map, set(forms))
+    subs['cik'] = int(cik)
+    if len(facts) == 0:
+        return pd.DataFrame(columns=tag_names_list)
+    if kind == 'YTD':
+        selected = statement_datasets.select_YTD_facts(facts, subs, use_dei)
+        dei_counts = None
+        if use_dei:
+            dei_counts = statement_datasets.dei_share_counts(_dei_shares(companyfacts, subs), subs)
+    else:
+        selected = statement_datasets.select_latest_Q_facts(facts)
+        dei_counts = None
+    merged = statement_datasets.merge_filings(selected, dei_counts, subs)
+    return statement_datasets.to_frames(merged, tag_names_list, kind)[int(cik)]
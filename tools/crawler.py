@@ -3,24 +3,48 @@
 # shamelessly borrowed from https://github.com/coyo8/sec-edgar and modified
 # so it can scrape for xbrl files instead of txt
 
-import requests
 import os
 import errno
 from bs4 import BeautifulSoup
 import datetime
 import re
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+from tools import transport, filing_store, sgml
 
 DEFAULT_DATA_PATH = os.path.join(os.getcwd(), "SEC-Edgar-Data", "")
+DEFAULT_MAX_WORKERS = 8
+EDGAR_BASE_URL = "http://www.sec.gov"
+MANIFEST_FILE = 'manifest.json'
+# number of filings asked for in every request of an incremental crawl
+INCREMENTAL_PAGE_SIZE = 10
+ACCESSION_NUMBER_RE = re.compile(r'(\d{10}-\d{2}-\d{6})')
+
+
+def get_accession_number(filing_link):
+    match = ACCESSION_NUMBER_RE.search(filing_link)
+    return match.group(1) if match is not None else filing_link
+
 
 class SecCrawler(object):
 
-    def __init__(self, data_path=DEFAULT_DATA_PATH):
+    def __init__(self, data_path=DEFAULT_DATA_PATH, max_workers=DEFAULT_MAX_WORKERS, rate_limiter=None,
+                 compress=False, edgar_base_url=EDGAR_BASE_URL, incremental=True, keep_document_types=None):
         self.data_path = data_path
+        self.edgar_base_url = edgar_base_url
+        self.max_workers = max_workers
+        # keep the documents compressed and deduplicated in the filing store
+        self.compress = compress
+        # only fetch the filings that are newer than the ones already on disk
+        self.incremental = incremental
+        # in txt mode, keep only these document types out of every submission (e.g. sgml.DEFAULT_KEEP_TYPES)
+        self.keep_document_types = keep_document_types
+        self.rate_limiter = rate_limiter or transport.SEC_RATE_LIMITER
         print("Path of the directory where data will be saved: " + self.data_path)
 
     def __repr__(self):
-        return "SecCrawler(data_path={0})".format(self.data_path)
+        return "SecCrawler(data_path={0}, compress={1})".format(self.data_path, self.compress)
 
     def _make_directory(self, ticker, priorto, filing_type, doc_format):
         # Making the directory to save comapny filings
@@ -34,16 +58,41 @@ class SecCrawler(object):
                 if exception.errno != errno.EEXIST:
                     raise
 
+    def _get(self, url, **kwargs):
+        # all requests of the crawler share the pooled session, the cache and the sec.gov rate limiter
+        return transport.get(url, rate_limiter=self.rate_limiter, **kwargs)
+
+    def _save_document(self, url, doc_name):
+        path = os.path.join(self.full_path, doc_name)
+        if filing_store.is_stored(path):
+            return
+        # streamed to a temporary file and renamed once complete, so existing files are always whole
+        transport.download(url, path, rate_limiter=self.rate_limiter)
+        paths = [path]
+        if self.keep_document_types is not None and doc_name.endswith('.txt'):
+            # the submission is dropped after the split, the manifest keeps track of it. a submission which
+            # has none of the document types (or is malformed) is kept whole, so no data is lost
+            extracted = sgml.split_submission(path, self.full_path, self.keep_document_types)
+            if len(extracted) > 0:
+                os.remove(path)
+                paths = extracted
+        if self.compress:
+            for path in paths:
+                filing_store.store_file(path, self.data_path)
+
     def _save_in_directory(self, docs):
-        # Save every text document into its respective folder
-        for url, doc_name in tqdm(docs):
-            path = os.path.join(self.full_path, doc_name)
-            if os.path.isfile(path):
-                continue
-            r = requests.get(url)
-            data = r.text
-            with open(path, "ab") as f:
-                f.write(data.encode('ascii', 'ignore'))
+        # Save every text document into its respective folder, using a pool of workers
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._save_document, url, doc_name): doc_name
+                       for url, doc_name in docs}
+            failed = []
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                try:
+                    future.result()
+                except Exception as e:
+                    print("failed to download {0}: {1}".format(futures[future], str(e)))
+                    failed.append(futures[future])
+        return failed
 
     def _save_links_summary(self, link_list):
         path = os.path.join(self.full_path, 'links.txt')
@@ -51,8 +100,27 @@ class SecCrawler(object):
             for item in link_list:
                 f.write("%s\n" % item)
 
+    def _load_manifest(self):
+        # the manifest keeps the filings which were already retrieved for the current ticker and form (newest first)
+        path = os.path.join(self.full_path, MANIFEST_FILE)
+        if not self.incremental or not os.path.isfile(path):
+            return {'depth': 0, 'filings': [], 'pending': []}
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        # the filing links whose download failed, retried by every crawl until they are retrieved
+        manifest.setdefault('pending', [])
+        return manifest
+
+    def _save_manifest(self, manifest):
+        path = os.path.join(self.full_path, MANIFEST_FILE)
+        with open(path + '.part', 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + '.part', path)
+
     def _find_xbrl_link(self, base_url):
-        with requests.get(base_url) as r:
+        with self._get(base_url) as r:
+            # an error page has no xbrl link either, it must not be taken for a filing without xbrl
+            r.raise_for_status()
             data = r.text
         soup = BeautifulSoup(data, features='html.parser')
         # store the link in the list
@@ -74,14 +142,46 @@ class SecCrawler(object):
         # set_trace()
         return file_url, file_name
 
-    def _create_document_list(self, data, doc_type='txt'):
+    def _resolve_xbrl_link(self, base_url):
+        # a failed index page doesn't abort the other filings, its filing is retried by the next crawl
+        try:
+            return self._find_xbrl_link(base_url), None
+        except Exception as e:
+            return (None, None), e
+
+    def _parse_filing_links(self, data):
         # parse fetched data using beatifulsoup
         # Explicit parser needed
         soup = BeautifulSoup(data, features='html.parser')
-        # store the link in the list
-        link_list = [link.string for link in soup.find_all('filinghref')]
-        self._save_links_summary(link_list)
+        return [link.string for link in soup.find_all('filinghref')]
+
+    def _find_new_filing_links(self, base_url, params, known_accessions, count):
+        '''
+        walk the list of filings from the newest one backwards in small pages, and stop at the first filing
+        which was already retrieved in a previous crawl
+        '''
+        new_links = []
+        start = 0
+        while len(new_links) < count:
+            page_params = dict(params, start=start, count=INCREMENTAL_PAGE_SIZE)
+            with self._get(base_url, params=page_params) as r:
+                links = self._parse_filing_links(r.text)
+            for link in links:
+                if get_accession_number(link) in known_accessions:
+                    return new_links
+                new_links.append(link)
+            if len(links) < INCREMENTAL_PAGE_SIZE:
+                break
+            start += len(links)
+        return new_links[:count]
 
+    def _create_document_list(self, link_list, doc_type='txt'):
+        '''
+        returns a (filing link, document url, document name) tuple for every resolved filing,
+        the url and name are None when the filing has no document of the requested type,
+        and the list of the filing links whose index page could not be fetched
+        '''
+        unresolved = []
         # List of url to the text documents
         if doc_type == 'txt':
             urls = [link[:link.rfind("-")] + ".txt" for link in link_list]
@@ -89,16 +189,23 @@ class SecCrawler(object):
             doc_names = [url.split("/")[-1] for url in urls]
 
         elif doc_type == 'xbrl':
-            urls, doc_names = [], []
-            for link in link_list:
-                xbrl_url, doc_name = self._find_xbrl_link(link)
-                if xbrl_url is not None:
-                    urls.append(xbrl_url)
-                    doc_names.append(doc_name)
-
-        print("Number of files to download: {0}".format(len(doc_names)))
+            resolved, urls, doc_names = [], [], []
+            # resolve the index pages in parallel, map keeps the original order of the links
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                xbrl_links = list(pool.map(self._resolve_xbrl_link, link_list))
+            for link, ((xbrl_url, doc_name), error) in zip(link_list, xbrl_links):
+                if error is not None:
+                    print("failed to fetch the index page {0}: {1}".format(link, str(error)))
+                    unresolved.append(link)
+                    continue
+                resolved.append(link)
+                urls.append(xbrl_url)
+                doc_names.append(doc_name)
+            link_list = resolved
+
+        print("Number of files to download: {0}".format(len([url for url in urls if url is not None])))
         print("Starting download...")
-        return list(zip(urls, doc_names))
+        return list(zip(link_list, urls, doc_names)), unresolved
 
     def _sanitize_date(self, date):
         if isinstance(date, datetime.datetime):
@@ -115,41 +222,79 @@ class SecCrawler(object):
         self._make_directory(ticker, priorto, filing_type, doc_type)
 
         # generate the url to crawl
-        base_url = "http://www.sec.gov/cgi-bin/browse-edgar"
+        base_url = self.edgar_base_url + "/cgi-bin/browse-edgar"
         params = {'action': 'getcompany', 'owner': 'exclude', 'output': 'xml',
                   'CIK': cik, 'type': filing_type, 'dateb': priorto, 'count': count}
         print("started {filing_type} documents scraping for {company_name}".format(
             filing_type=filing_type, company_name=company_name))
-        with requests.get(base_url, params=params) as r:
-            data = r.text
+        manifest = self._load_manifest()
+        known_filings = {filing['accession']: filing for filing in manifest['filings']}
+        pending_links = [link for link in manifest['pending'] if get_accession_number(link) not in known_filings]
+        if len(known_filings) > 0 and count <= manifest['depth']:
+            # incremental crawl - only ask for the filings which are newer than the ones on disk
+            new_links = self._find_new_filing_links(base_url, params, known_filings, count)
+            print("{0} new filings since the last crawl".format(len(new_links)))
+            all_links = new_links + [filing['href'] for filing in manifest['filings']]
+        else:
+            with self._get(base_url, params=params) as r:
+                all_links = self._parse_filing_links(r.text)
+            new_links = [link for link in all_links if get_accession_number(link) not in known_filings]
+            all_links += [filing['href'] for filing in manifest['filings'] if filing['href'] not in all_links]
+        # the walk back stops at the first known filing, so the ones which failed before are added explicitly
+        retried_links = [link for link in pending_links if link not in new_links]
+        if len(retried_links) > 0:
+            print("retrying {0} filings which failed in a previous crawl".format(len(retried_links)))
+        new_links += retried_links
+        all_links += [link for link in retried_links if link not in all_links]
 
         # get doc list data
-        docs = self._create_document_list(data, doc_type)
+        documents, unresolved = self._create_document_list(new_links, doc_type)
+        docs = [(url, doc_name) for _, url, doc_name in documents if url is not None]
 
         try:
-            self._save_in_directory(docs)
+            failed = self._save_in_directory(docs)
         except Exception as e:
             print(str(e))
+            failed = [doc_name for _, doc_name in docs]
+
+        # failed downloads and index pages are kept as pending in the manifest, so they will be retried by the
+        # next crawl. only the filings whose index page was read and has no document are known without one
+        pending = list(unresolved)
+        for link, _, doc_name in documents:
+            if doc_name is None or doc_name not in failed:
+                known_filings[get_accession_number(link)] = {
+                    'accession': get_accession_number(link), 'href': link, 'document': doc_name}
+            else:
+                pending.append(link)
+        manifest['filings'] = [known_filings[get_accession_number(link)] for link in all_links
+                               if get_accession_number(link) in known_filings]
+        manifest['pending'] = pending
+        manifest['depth'] = max(manifest['depth'], count)
+        if self.incremental:
+            self._save_manifest(manifest)
+        self._save_links_summary(all_links)
 
-        print("Successfully downloaded {0} files ".format(len(docs)))
+        print("Successfully downloaded {0} files ".format(len(docs) - len(failed)))
+        # the filings whose index page failed are reported as failed too
+        return docs, failed + unresolved
 
     def filing_10Q(self, ticker, cik, company_name, priorto, count, doc_type='txt'):
-        self._fetch_report(ticker, cik, company_name, priorto, count, '10-Q', doc_type)
+        return self._fetch_report(ticker, cik, company_name, priorto, count, '10-Q', doc_type)
 
     def filing_10K(self, ticker, cik, company_name, priorto, count, doc_type='txt'):
-        self._fetch_report(ticker, cik, company_name, priorto, count, '10-K', doc_type)
+        return self._fetch_report(ticker, cik, company_name, priorto, count, '10-K', doc_type)
 
     def filing_8K(self, ticker, cik, company_name, priorto, count, doc_type='txt'):
-        self._fetch_report(ticker, cik, company_name, priorto, count, '8-K', doc_type)
+        return self._fetch_report(ticker, cik, company_name, priorto, count, '8-K', doc_type)
 
     def filing_13F(self, ticker, cik, company_name, priorto, count, doc_type='txt'):
-        self._fetch_report(ticker, cik, company_name, priorto, count, '13-F', doc_type)
+        return self._fetch_report(ticker, cik, company_name, priorto, count, '13-F', doc_type)
 
     def filing_20F(self, ticker, cik, company_name, priorto, count, doc_type='txt'):
-        self._fetch_report(ticker, cik, company_name, priorto, count, '20-F', doc_type)
+        return self._fetch_report(ticker, cik, company_name, priorto, count, '20-F', doc_type)
 
     def filing_SD(self, ticker, cik, company_name, priorto, count, doc_type='txt'):
-        self._fetch_report(ticker, cik, company_name, priorto, count, 'SD', doc_type)
+        return self._fetch_report(ticker, cik, company_name, priorto, count, 'SD', doc_type)
 
     def filing_4(self, ticker, cik, company_name, priorto, count, doc_type='txt'):
-        self._fetch_report(ticker, cik, company_name, priorto, count, '4', doc_type)
+        return self._fetch_report(ticker, cik, company_name, priorto, count, '4', doc_type)
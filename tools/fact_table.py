@@ -0,0 +1,207 @@
+# Compact columnar table of all the numeric facts of one or more XBRL filings.
+# Every column is a NumPy array (no Python object per fact). Concepts, contexts, units and filings are
+# interned to ints, so a table of a whole decade of filings takes a few MB and can be filtered by
+# concept and period without touching the XML again.
+
+import numpy as np
+import pandas as pd
+from array import array
+
+# column name -> dtype
+COLUMNS = {'concept': np.int32, 'context': np.int32, 'unit': np.int32, 'filing': np.int32,
+           'start': 'datetime64[D]', 'end': 'datetime64[D]', 'has_dimensions': np.bool_,
+           'decimals': np.float64, 'value': np.float64}
+
+
+class FactTableBuilder(object):
+    '''
+    accumulates the numeric facts of a single document while it is being read
+    '''
+
+    def __init__(self, filing=''):
+        self.filing = filing
+        self.concepts, self.contexts, self.units = {}, {}, {}
+        self.concept = array('i')
+        self.context = array('i')
+        self.unit = array('i')
+        self.decimals = array('d')
+        self.value = array('d')
+
+    @staticmethod
+    def _intern(table, key):
+        if key not in table:
+            table[key] = len(table)
+        return table[key]
+
+    def add(self, concept, context_id, unit, decimals, text):
+        try:
+            value = float(text)
+        except (TypeError, ValueError):
+            # nil or non numeric fact
+            return
+        try:
+            decimals = float(decimals)
+        except (TypeError, ValueError):
+            # INF or missing
+            decimals = np.nan
+        self.concept.append(self._intern(self.concepts, concept))
+        self.context.append(self._intern(self.contexts, context_id))
+        self.unit.append(self._intern(self.units, unit))
+        self.decimals.append(decimals)
+        self.value.append(value)
+
+    def build(self, context_table):
+        '''
+        context_table - list of Context records of the document (see tools/xbrl_parser.py)
+        '''
+        contexts_by_id = {context.id: context for context in context_table}
+        no_date = np.datetime64('NaT', 'D')
+        n_contexts = len(self.contexts)
+        context_start = np.full(n_contexts, no_date)
+        context_end = np.full(n_contexts, no_date)
+        context_dims = np.zeros(n_contexts, dtype=np.bool_)
+        for context_id, idx in self.contexts.items():
+            context = contexts_by_id.get(context_id)
+            if context is None:
+                continue
+            if context.instant is not None:
+                context_end[idx] = np.datetime64(context.instant.date(), 'D')
+            else:
+                context_start[idx] = np.datetime64(context.startdate.date(), 'D')
+                context_end[idx] = np.datetime64(context.enddate.date(), 'D')
+            context_dims[idx] = context.has_dimensions
+
+        context = np.array(self.context, dtype=np.int32)
+        columns = {'concept': np.array(self.concept, dtype=np.int32),
+                   'context': context,
+                   'unit': np.array(self.unit, dtype=np.int32),
+                   'filing': np.zeros(len(self.value), dtype=np.int32),
+                   'start': context_start[context],
+                   'end': context_end[context],
+                   'has_dimensions': context_dims[context],
+                   'decimals': np.array(self.decimals, dtype=np.float64),
+                   'value': np.array(self.value, dtype=np.float64)}
+        return FactTable(columns, list(self.concepts), list(self.contexts), list(self.units), [self.filing])
+
+
+class FactTable(object):
+
+    def __init__(self, columns=None, concepts=None, contexts=None, units=None, filings=None):
+        if columns is None:
+            columns = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.columns = columns
+        # lookup tables of the interned columns
+        self.concepts = concepts or []
+        self.contexts = contexts or []
+        self.units = units or []
+        self.filings = filings or []
+        self._concept_ids = {concept: idx for idx, concept in enumerate(self.concepts)}
+        self._concept_order = None
+
+    def __repr__(self):
+        return "FactTable(facts={0}, concepts={1}, filings={2})".format(len(self), len(self.concepts),
+                                                                         len(self.filings))
+
+    def __len__(self):
+        return len(self.columns['value'])
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_concept_order'] = None
+        return state
+
+    @staticmethod
+    def concat(tables):
+        '''
+        merge tables (usually of different filings) into one, re-interning the lookup tables
+        '''
+        tables = [table for table in tables if table is not None]
+        concepts, contexts, units, filings = {}, {}, {}, {}
+        parts = {name: [] for name in COLUMNS}
+        for table in tables:
+            remaps = {}
+            for name, lookup, values in (('concept', concepts, table.concepts), ('context', contexts, table.contexts),
+                                         ('unit', units, table.units), ('filing', filings, table.filings)):
+                remap = np.array([lookup.setdefault(value, len(lookup)) for value in values], dtype=np.int32)
+                remaps[name] = remap
+            for name in COLUMNS:
+                column = table.columns[name]
+                if name in remaps and len(column) > 0:
+                    column = remaps[name][column]
+                parts[name].append(column)
+        columns = {name: np.concatenate(parts[name]).astype(dtype) if len(parts[name]) > 0 else
+                   np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        return FactTable(columns, list(concepts), list(contexts), list(units), list(filings))
+
+    def _concept_slice(self, concept):
+        # the facts are sorted by concept once, then every concept lookup is a binary search
+        if self._concept_order is None:
+            self._concept_order = np.argsort(self.columns['concept'], kind='stable')
+            self._sorted_concepts = self.columns['concept'][self._concept_order]
+        concept_id = self._concept_ids.get(concept.lower(), -1)
+        lo = np.searchsorted(self._sorted_concepts, concept_id, side='left')
+        hi = np.searchsorted(self._sorted_concepts, concept_id, side='right')
+        return self._concept_order[lo:hi]
+
+    def select(self, concept=None, start=None, end=None, min_days=None, max_days=None, instant=None,
+               dimensions=False):
+        '''
+        returns the row indices of the facts matching all the given filters.
+        concept - full concept name, like 'us-gaap:revenues'
+        start / end - exact period start / end dates (anything np.datetime64 accepts)
+        min_days / max_days - duration of the period in days
+        instant - True for instant facts only, False for duration facts only
+        dimensions - False keeps only facts without dimensions, True only dimensional facts, None keeps both
+        '''
+        if concept is not None:
+            rows = self._concept_slice(concept)
+        else:
+            rows = np.arange(len(self))
+        mask = np.ones(len(rows), dtype=np.bool_)
+        period_start = self.columns['start'][rows]
+        period_end = self.columns['end'][rows]
+        if start is not None:
+            mask &= period_start == np.datetime64(start, 'D')
+        if end is not None:
+            mask &= period_end == np.datetime64(end, 'D')
+        if instant is not None:
+            mask &= np.isnat(period_start) == instant
+        if min_days is not None or max_days is not None:
+            days = (period_end - period_start).astype(np.float64)
+            if min_days is not None:
+                mask &= days >= min_days
+            if max_days is not None:
+                mask &= days <= max_days
+        if dimensions is not None:
+            mask &= self.columns['has_dimensions'][rows] == dimensions
+        return rows[mask]
+
+    def to_frame(self, rows=None):
+        '''
+        decode (some of) the rows to a DataFrame with readable concept / context / unit / filing names
+        '''
+        if rows is None:
+            rows = np.arange(len(self))
+        frame = pd.DataFrame({name: self.columns[name][rows] for name in COLUMNS})
+        for name, lookup in (('concept', self.concepts), ('context', self.contexts),
+                             ('unit', self.units), ('filing', self.filings)):
+            frame[name] = np.array(lookup, dtype=object)[frame[name].values] if len(lookup) > 0 else None
+        return frame
+
+    def lookup(self, concept, **filters):
+        return self.to_frame(self.select(concept, **filters))
+
+    def save(self, path):
+        np.savez_compressed(path, concepts=np.array(self.concepts, dtype=object),
+                            contexts=np.array(self.contexts, dtype=object), units=np.array(self.units, dtype=object),
+                            filings=np.array(self.filings, dtype=object), **self.columns)
+
+    @staticmethod
+    def load(path):
+        with np.load(path, allow_pickle=True) as data:
+            columns = {name: data[name] for name in COLUMNS}
+            return FactTable(columns, data['concepts'].tolist(), data['contexts'].tolist(),
+                             data['units'].tolist(), data['filings'].tolist())
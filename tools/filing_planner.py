@@ -0,0 +1,146 @@
+# Planner of the minimal set of yearly filings to parse for a history of fiscal years.
+# Every 10-K reports the income and cash flow statements of its fiscal year and the two years before, and the
+# balance sheet of its fiscal year and the year before, so parsing every filing of a ten years history mostly
+# re-reads the same numbers. The planner reads only the DEI header of every filing (period end date and fiscal
+# year focus, found at the top of the document), picks the newest filings which together cover the requested
+# years of both the balance sheet (instant) and the other (duration) fields, and XBRL.load_minimal() falls
+# back to older filings only for the values that are still missing.
+
+import re
+from datetime import datetime
+from lxml import etree
+
+from tools.filing_store import open_filing
+from config.xbrl_config import INSTANT_TAGS
+
+# fiscal years reported by a yearly filing, counting back from its fiscal year focus
+DURATION_YEARS_PER_FILING = 3
+INSTANT_YEARS_PER_FILING = 2
+FILE_DATE_RE = re.compile(r'.*?([0-9]{8})\.xml$')
+
+
+class FilingHeader(object):
+    '''
+    the DEI header of a filing
+    '''
+    __slots__ = ('path', 'period_end', 'fiscal_year')
+
+    def __init__(self, path, period_end=None, fiscal_year=None):
+        self.path = path
+        self.period_end = period_end
+        self.fiscal_year = fiscal_year
+
+    def __repr__(self):
+        return "FilingHeader(%s, period_end=%s, fiscal_year=%s)" % (self.path, self.period_end, self.fiscal_year)
+
+    def covered_years(self, years_per_filing=DURATION_YEARS_PER_FILING):
+        if self.fiscal_year is None:
+            return set()
+        return set(range(self.fiscal_year - years_per_filing + 1, self.fiscal_year + 1))
+
+
+def years_per_filing(field):
+    '''
+    the number of fiscal years a yearly filing reports for the field
+    '''
+    return INSTANT_YEARS_PER_FILING if field in INSTANT_TAGS else DURATION_YEARS_PER_FILING
+
+
+def read_filing_header(path):
+    '''
+    read the period end date and fiscal year focus of a filing, stopping as soon as both were found.
+    filings without them fall back to the date in the file name (e.g. aapl-20190928.xml), with the
+    same year rule of thumb as XBRL._find_YTD_contexts
+    '''
+    header = FilingHeader(path)
+    with open_filing(path) as fh:
+        try:
+            for _, elem in etree.iterparse(fh, events=('end',), huge_tree=True):
+                if isinstance(elem.tag, str):
+                    name = etree.QName(elem).localname
+                    if name == 'DocumentPeriodEndDate' and elem.text:
+                        header.period_end = datetime.strptime(elem.text.strip()[:10], '%Y-%m-%d')
+                    elif name == 'DocumentFiscalYearFocus' and elem.text:
+                        header.fiscal_year = int(elem.text.strip())
+                if header.period_end is not None and header.fiscal_year is not None:
+                    break
+                if elem.getparent() is not None and elem.getparent().getparent() is None:
+                    # direct child of the root, nothing of it is needed anymore
+                    elem.clear()
+        except (etree.XMLSyntaxError, ValueError):
+            pass
+    if header.period_end is None:
+        match = FILE_DATE_RE.match(path)
+        if match is not None:
+            try:
+                header.period_end = datetime.strptime(match.group(1), '%Y%m%d')
+            except ValueError:
+                pass
+    if header.fiscal_year is None and header.period_end is not None:
+        header.fiscal_year = header.period_end.year if header.period_end.month >= 3 else header.period_end.year - 1
+    return header
+
+
+def _newest_first(headers):
+    return sorted(headers, key=lambda header: (header.period_end or datetime.min, header.path), reverse=True)
+
+
+def default_years(headers):
+    '''
+    the fiscal years that loading all the filings would give
+    '''
+    years = set()
+    for header in headers:
+        years |= header.covered_years()
+    return years
+
+
+def _plan_cover(planned, remaining, years, years_per_filing):
+    # picking greedily from the latest uncovered year down
+    uncovered = set(years)
+    for header in planned:
+        uncovered -= header.covered_years(years_per_filing)
+    while len(uncovered) > 0:
+        year = max(uncovered)
+        candidates = [header for header in remaining if year in header.covered_years(years_per_filing)]
+        if len(candidates) == 0:
+            uncovered.discard(year)
+            continue
+        # among the filings covering the year, the one reaching furthest back (the newest of them on ties)
+        chosen = min(candidates, key=lambda header: header.fiscal_year)
+        planned.append(chosen)
+        remaining.remove(chosen)
+        uncovered -= chosen.covered_years(years_per_filing)
+
+
+def plan_filings(headers, years=None, fields=None):
+    '''
+    the first wave of filings to parse: the newest filings which cover all the requested years, first of the
+    balance sheet fields (which are reported for fewer years) and then of the others.
+    fields - the fields which should be complete (default is all of them).
+    filings without a known fiscal year are always parsed
+    '''
+    if years is None:
+        years = default_years(headers)
+    planned = [header for header in headers if header.fiscal_year is None]
+    remaining = _newest_first(header for header in headers if header.fiscal_year is not None)
+    covers = set(years_per_filing(field) for field in fields) if fields is not None else \
+        {INSTANT_YEARS_PER_FILING, DURATION_YEARS_PER_FILING}
+    for cover in sorted(covers):
+        _plan_cover(planned, remaining, years, cover)
+    return planned
+
+
+def plan_fallback(headers, missing_years, years_per_filing=DURATION_YEARS_PER_FILING):
+    '''
+    the next wave of filings to parse: for every year which still misses values, the newest filing
+    covering it which was not parsed yet
+    '''
+    planned = []
+    for year in sorted(missing_years, reverse=True):
+        for header in _newest_first(headers):
+            if year in header.covered_years(years_per_filing):
+                if header not in planned:
+                    planned.append(header)
+                break
+    return planned
@@ -0,0 +1,116 @@
+# Optional storage backend for downloaded filings.
+# Documents are kept compressed (zstd if the optional zstandard package is installed, gzip otherwise) in a
+# content-addressed object folder, so amended or re-downloaded copies of the same document are stored once.
+# The original location of the document keeps a tiny <doc_name>.ref file pointing to the object,
+# and open_filing() reads either representation transparently with streaming decompression.
+
+import io
+import os
+import json
+import gzip
+import shutil
+import hashlib
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+OBJECTS_FOLDER = 'objects'
+REF_SUFFIX = '.ref'
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_CODEC = 'zstd' if zstandard is not None else 'gzip'
+CODEC_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _open_compressed(path, mode, codec):
+    if codec == 'gzip':
+        return gzip.open(path, mode)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError('the zstandard package is needed to read %s' % path)
+        if mode == 'rb':
+            # the zstd stream reader can't be iterated line by line (nor readline), the buffered reader can
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True),
+                                     CHUNK_SIZE)
+        return zstandard.ZstdCompressor(level=10).stream_writer(open(path, 'wb'), closefd=True)
+    raise ValueError('unknown codec %s' % codec)
+
+
+def is_stored(path):
+    return os.path.isfile(path) or os.path.isfile(path + REF_SUFFIX)
+
+
+def store_file(path, data_path, codec=DEFAULT_CODEC):
+    '''
+    move a downloaded document into the compressed object store and replace it with a .ref file.
+    data_path is the root folder of the downloaded data (the objects folder is created inside it)
+    '''
+    sha256 = _hash_file(path)
+    object_path = os.path.join(data_path, OBJECTS_FOLDER, sha256[:2], sha256 + CODEC_EXTENSIONS[codec])
+    if not os.path.isfile(object_path):
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        # the same content might be stored by several threads / processes at once, every one of them writes
+        # its own temporary file, and the (identical) objects replace each other atomically
+        fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=os.path.dirname(object_path))
+        os.close(fd)
+        try:
+            with open(path, 'rb') as src, _open_compressed(tmp_path, 'wb', codec) as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            os.replace(tmp_path, object_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    ref = {'sha256': sha256, 'codec': codec, 'size': os.path.getsize(path),
+           'object': os.path.relpath(object_path, os.path.dirname(path))}
+    tmp_path = path + REF_SUFFIX + '.part'
+    with open(tmp_path, 'w') as f:
+        json.dump(ref, f)
+    os.replace(tmp_path, path + REF_SUFFIX)
+    os.remove(path)
+    return object_path
+
+
+def compact_folder(data_path, codec=DEFAULT_CODEC):
+    '''
+    move all the plain documents (xml / txt) under data_path into the compressed store
+    '''
+    objects_path = os.path.join(data_path, OBJECTS_FOLDER)
+    for root, _, files in os.walk(data_path):
+        if root.startswith(objects_path):
+            continue
+        for file in files:
+            if file.endswith('.xml') or (file.endswith('.txt') and file != 'links.txt'):
+                store_file(os.path.join(root, file), data_path, codec)
+
+
+def get_content_hash(path):
+    '''
+    sha256 of the content of a document. for stored documents it is read from the .ref file
+    '''
+    if os.path.isfile(path):
+        return _hash_file(path)
+    with open(path + REF_SUFFIX, 'r') as f:
+        return json.load(f)['sha256']
+
+
+def open_filing(path):
+    '''
+    open a document for binary reading, either a plain file or a compressed object behind a .ref file
+    '''
+    if os.path.isfile(path):
+        return open(path, 'rb')
+    with open(path + REF_SUFFIX, 'r') as f:
+        ref = json.load(f)
+    object_path = os.path.normpath(os.path.join(os.path.dirname(path), ref['object']))
+    return _open_compressed(object_path, 'rb', ref['codec'])
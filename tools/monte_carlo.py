@@ -0,0 +1,157 @@
+# Monte Carlo valuation on top of the vectorized valuation functions (tools/valuation_funcs.py).
+# Instead of a single guess of the growth rate and the normalized P/E, every company gets distributions fit to its
+# history (the CAGRs of its key values and its yearly P/E ratios), N samples of growth, discount rate, terminal
+# growth and P/E are drawn and evaluated in one batch, and the fair value is reported as percentiles.
+# The discount rate and the terminal growth rate are market wide assumptions, so their samples are shared by all the
+# companies (which also keeps the valuations of different companies comparable). Companies are processed in chunks
+# which fit in a memory budget and evaluated on a pool of threads (numpy releases the GIL in the heavy operations),
+# so a whole universe of tickers with 100k samples each can be valued in one call. Every company draws its samples
+# from its own random stream, derived from the seed and its position, so the results don't depend on the chunking.
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from tools import valuation_funcs
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_MAX_MEMORY_MB = 512
+# the sampled inputs are float32 (percentiles of fair values don't need more precision and they are drawn faster),
+# the valuation functions compute in float64
+SAMPLE_DTYPE = np.float32
+# float64 arrays alive per sample while a chunk is evaluated (the sampled inputs, intermediates and the outputs)
+ARRAYS_PER_SAMPLE = 8
+
+# priors used when the history of the company is too short, and the bounds of the sampled values (in percents)
+DEFAULT_GROWTH = (8.0, 4.0)  # mean, standard deviation
+MIN_GROWTH_STD = 2.0
+GROWTH_RANGE = (0.0, 25.0)
+DEFAULT_PE = (15.0, 0.3)  # median, standard deviation of the log P/E
+MIN_PE_LOG_STD = 0.1
+PE_RANGE = (5.0, 50.0)
+DISCOUNT_RATE = (12.0, 1.5)  # mean, standard deviation
+DISCOUNT_RATE_RANGE = (6.0, 20.0)
+TERMINAL_GROWTH_RATE = (4.0, 1.0)  # mean, standard deviation
+TERMINAL_GROWTH_RATE_RANGE = (0.0, 6.0)
+# years of growth of the normalized P/E valuation (like the high value of calc_growth_at_normalized_PE)
+PE_GROWTH_YEARS = 6
+
+
+def _valid(values):
+    values = np.asarray([value for value in values if value is not None], dtype=np.float64)
+    return values[np.isfinite(values)]
+
+
+def fit_valuation_prior(cagrs, pes):
+    '''
+    fit the growth and P/E distributions of a company.
+    cagrs - historical CAGRs (in percents) of the key values of the company
+    pes - historical P/E ratios of the company
+    '''
+    cagrs = _valid(cagrs)
+    if len(cagrs) >= 2:
+        growth_mean, growth_std = np.mean(cagrs), max(np.std(cagrs), MIN_GROWTH_STD)
+    elif len(cagrs) == 1:
+        growth_mean, growth_std = cagrs[0], DEFAULT_GROWTH[1]
+    else:
+        growth_mean, growth_std = DEFAULT_GROWTH
+    growth_mean = min(max(growth_mean, GROWTH_RANGE[0]), GROWTH_RANGE[1])
+
+    pes = _valid(pes)
+    pes = pes[pes > 0]
+    if len(pes) >= 2:
+        pe_log_mean, pe_log_std = np.mean(np.log(pes)), max(np.std(np.log(pes)), MIN_PE_LOG_STD)
+    else:
+        pe_log_mean, pe_log_std = np.log(pes[0] if len(pes) == 1 else DEFAULT_PE[0]), DEFAULT_PE[1]
+    pe_log_mean = min(max(pe_log_mean, np.log(PE_RANGE[0])), np.log(PE_RANGE[1]))
+    return {'growth_mean': growth_mean, 'growth_std': growth_std, 'pe_log_mean': pe_log_mean,
+            'pe_log_std': pe_log_std}
+
+
+def _random_state(seed, stream):
+    # the Generator of newer numpy versions draws normal samples a few times faster than RandomState
+    if hasattr(np.random, 'default_rng'):
+        return np.random.default_rng([seed, stream])
+    return np.random.RandomState([seed, stream])
+
+
+def _standard_normal(random_state, n_samples):
+    if isinstance(random_state, np.random.RandomState):
+        return random_state.standard_normal(n_samples).astype(SAMPLE_DTYPE)
+    return random_state.standard_normal(n_samples, dtype=SAMPLE_DTYPE)
+
+
+def _draw(samples, mean, std, value_range):
+    samples *= std
+    samples += mean
+    return np.clip(samples, value_range[0], value_range[1], out=samples)
+
+
+def _chunk_size(n_samples, max_memory_mb, workers):
+    bytes_per_company = n_samples * ARRAYS_PER_SAMPLE * 8
+    return max(1, int(max_memory_mb * 1024 * 1024 // (bytes_per_company * workers)))
+
+
+def monte_carlo_valuation(latest_fcf, eps_ttm, priors, n_samples=100000, percentiles=DEFAULT_PERCENTILES,
+                          seed=None, max_memory_mb=DEFAULT_MAX_MEMORY_MB, workers=None):
+    '''
+    Monte Carlo version of DCF_FCF and calc_growth_at_normalized_PE for many companies.
+    latest_fcf, eps_ttm - the free cash flow and EPS per share of every company (scalars or arrays)
+    priors - the fit_valuation_prior() of every company (a dict, a list of dicts or a DataFrame, whose index
+             is used as the index of the results)
+    seed - the results are reproducible for a given seed
+    max_memory_mb - memory budget of the samples of all the chunks evaluated at the same time
+    returns a dict of method ('DCF', 'NormalizedPE') -> DataFrame of the fair value percentiles of every company,
+    with nan for companies with a non positive FCF / EPS
+    '''
+    if isinstance(priors, dict):
+        priors = [priors]
+    priors = pd.DataFrame(priors)
+    n_companies = len(priors)
+    latest_fcf = np.broadcast_to(np.asarray(latest_fcf, dtype=np.float64), (n_companies,))
+    eps_ttm = np.broadcast_to(np.asarray(eps_ttm, dtype=np.float64), (n_companies,))
+    if seed is None:
+        seed = np.random.randint(2 ** 31)
+    workers = workers or os.cpu_count() or 1
+    chunk = _chunk_size(n_samples, max_memory_mb, workers)
+
+    # the market wide samples, stream 0
+    random_state = _random_state(seed, 0)
+    discount_rate = _draw(_standard_normal(random_state, n_samples), DISCOUNT_RATE[0], DISCOUNT_RATE[1],
+                          DISCOUNT_RATE_RANGE)
+    terminal_growth_rate = _draw(_standard_normal(random_state, n_samples), TERMINAL_GROWTH_RATE[0],
+                                 TERMINAL_GROWTH_RATE[1], TERMINAL_GROWTH_RATE_RANGE)
+    pe_log_range = np.log(PE_RANGE)
+    growth_mean, growth_std = priors['growth_mean'].values, priors['growth_std'].values
+    pe_log_mean, pe_log_std = priors['pe_log_mean'].values, priors['pe_log_std'].values
+
+    dcf = np.full((n_companies, len(percentiles)), np.nan)
+    normalized_pe = np.full((n_companies, len(percentiles)), np.nan)
+
+    def evaluate_chunk(start):
+        end = min(start + chunk, n_companies)
+        growth = np.empty((end - start, n_samples), dtype=SAMPLE_DTYPE)
+        pe = np.empty((end - start, n_samples), dtype=SAMPLE_DTYPE)
+        for idx in range(start, end):
+            # every company has its own stream, the market wide samples are stream 0
+            random_state = _random_state(seed, idx + 1)
+            growth[idx - start] = _draw(_standard_normal(random_state, n_samples), growth_mean[idx],
+                                        growth_std[idx], GROWTH_RANGE)
+            pe[idx - start] = _draw(_standard_normal(random_state, n_samples), pe_log_mean[idx], pe_log_std[idx],
+                                    pe_log_range)
+        np.exp(pe, out=pe)
+
+        values = valuation_funcs.DCF_accumulated_ratios(growth, discount_rate, terminal_growth_rate)
+        dcf[start:end] = latest_fcf[start:end, None] * np.percentile(values, percentiles, axis=1).T
+        values = valuation_funcs.normalized_PE_value_array(1, pe, growth, discount_rate, PE_GROWTH_YEARS)
+        normalized_pe[start:end] = eps_ttm[start:end, None] * np.percentile(values, percentiles, axis=1).T
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(evaluate_chunk, range(0, n_companies, chunk)))
+
+    dcf[latest_fcf <= 0] = np.nan
+    normalized_pe[eps_ttm <= 0] = np.nan
+    columns = ['p%d' % percentile for percentile in percentiles]
+    return {'DCF': pd.DataFrame(dcf, index=priors.index, columns=columns),
+            'NormalizedPE': pd.DataFrame(normalized_pe, index=priors.index, columns=columns)}
@@ -0,0 +1,182 @@
+# Panel version of the analysis of stock_analysis.py, for scoring a whole universe of tickers at once.
+# The fundamentals of all the tickers are held in a single frame indexed by (ticker, period), and the key values,
+# the CAGRs and the valuations are computed as grouped, columnar operations over the whole frame, so the run time
+# grows with the number of rows and columns and not with a Python loop over the tickers.
+# The frames of XBRL.get_data_df(), load_statement_datasets() or load_companyfacts() make a panel with build_panel().
+#
+# usage example:
+#     frames = statement_datasets.load_statement_datasets(['2019q1.zip', '2019q2.zip', '2019q3.zip', '2019q4.zip'])
+#     results = analyze_panel(build_panel(frames))
+#     print(results['valuations'].sort_values('DCF_low', ascending=False).head(20))
+
+import numpy as np
+import pandas as pd
+
+from tools import utils, valuation_funcs
+
+PANEL_INDEX_NAMES = ['ticker', 'period']
+SHARE_COLUMNS = ['NumberOfShares', 'NumberOfDilutedShares']
+GROWTH_COLUMNS = ['BookValuePerShare', 'EarningPerShare(Diluted)', 'OI (or EBIT)', 'RevenuePerShare(Diluted)',
+                  'FreeCashFlowPerShare(Diluted)']
+# the default estimations of stock_analysis.main()
+GROWTH_RANGE = (5, 15)
+FCF_GROWTH_RANGE = (5, 20)
+MIN_PE = 5
+PE_PREMIUM = 1.1
+OWNER_EARNINGS_YEARS = 10
+
+
+def build_panel(data, ticker_column='ticker', period_column='period'):
+    '''
+    a (ticker, period) indexed frame, sorted by ticker and period, out of either
+    a dict of ticker -> DataFrame (periods x fields), a long frame with ticker and period columns,
+    or a frame which already has a (ticker, period) MultiIndex
+    '''
+    if isinstance(data, dict):
+        panel = pd.concat(data, names=PANEL_INDEX_NAMES)
+    elif isinstance(data.index, pd.MultiIndex):
+        panel = data.copy()
+        panel.index.names = PANEL_INDEX_NAMES
+    else:
+        panel = data.set_index([ticker_column, period_column])
+        panel.index.names = PANEL_INDEX_NAMES
+    return _fiscal_year_rows(panel).sort_index()
+
+
+def _fiscal_year_rows(panel):
+    '''
+    the rows of the panel whose period is a (numeric) fiscal year, rows of other periods (e.g. a 'TTM' row) are dropped
+    '''
+    periods = pd.to_numeric(pd.Series(panel.index.get_level_values(1)), errors='coerce').values
+    is_year = ~np.isnan(periods.astype(np.float64))
+    if not is_year.all():
+        print('dropping {0} panel rows which are not fiscal years'.format((~is_year).sum()))
+    panel = panel[is_year]
+    periods = periods[is_year]
+    if np.all(periods == np.round(periods)):
+        periods = periods.astype(np.int64)
+    panel.index = pd.MultiIndex.from_arrays([panel.index.get_level_values(0), periods], names=PANEL_INDEX_NAMES)
+    return panel
+
+
+def add_split_adjusted_shares(panel):
+    '''
+    adds the split adjusted share counts (NumberOfSharesAdjusted, NumberOfDilutedSharesAdjusted) of all the
+    tickers of the panel, detecting the splits of both series in one pass
+    '''
+    adjusted_counts = utils.estimate_stock_split_adjustments(panel[SHARE_COLUMNS])
+    panel = panel.copy()
+    for column in SHARE_COLUMNS:
+        panel[column + 'Adjusted'] = adjusted_counts[column]
+    return panel
+
+
+def _shares(panel, adjusted_column, column):
+    if adjusted_column in panel.columns:
+        return panel[adjusted_column]
+    return panel[column]
+
+
+def calculate_panel_key_values(panel):
+    '''
+    calculate_key_values of stock_analysis.py for all the tickers of the panel.
+    the split adjusted share counts are used when the panel has them
+    '''
+    shares = _shares(panel, 'NumberOfSharesAdjusted', 'NumberOfShares')
+    diluted_shares = _shares(panel, 'NumberOfDilutedSharesAdjusted', 'NumberOfDilutedShares').fillna(shares)
+    key_values = pd.DataFrame(index=panel.index)
+    key_values['ROIC'] = valuation_funcs.calculate_ROIC(panel)
+    key_values['BookValuePerShare'] = panel['StockholdersEquity'].divide(shares)
+    key_values['EarningPerShare(Diluted)'] = panel['NetIncomeLoss'].divide(diluted_shares)
+    key_values['OI (or EBIT)'] = panel['OperatingIncomeLoss']
+    key_values['RevenuePerShare(Diluted)'] = panel['Revenues'].divide(diluted_shares)
+    key_values['FreeCashFlowPerShare(Diluted)'] = \
+        (panel['CashFlowFromOperations'] - panel['CapitalExpenditure']).divide(diluted_shares)
+    if 'StockPrice' in panel.columns:
+        key_values['P/E'] = panel['StockPrice'].divide(key_values['EarningPerShare(Diluted)'])
+    else:
+        key_values['P/E'] = np.nan
+    return key_values
+
+
+def _latest_rows(index):
+    '''
+    the position of the latest row of its ticker, for every row of a sorted panel index
+    '''
+    codes = index.codes[0]
+    is_last = np.ones(len(codes), dtype=bool)
+    is_last[:-1] = codes[1:] != codes[:-1]
+    latest = np.flatnonzero(is_last)
+    return np.repeat(latest, np.diff(np.concatenate([[-1], latest])))
+
+
+def calculate_panel_cagrs(key_values, columns=GROWTH_COLUMNS):
+    '''
+    calculate_cagr_of_time_series for all the tickers and columns of a panel: the CAGR (in percents)
+    from every period to the latest period of the ticker, nan in the latest period
+    '''
+    latest = _latest_rows(key_values.index)
+    # periods which are not fiscal years (see build_panel) have no CAGR
+    periods = pd.to_numeric(pd.Series(key_values.index.get_level_values(1)), errors='coerce').values.astype(np.float64)
+    values = key_values[columns].values.astype(np.float64)
+    cagrs = valuation_funcs.calculate_cagr_array(values, values[latest], (periods[latest] - periods)[:, None])
+    return pd.DataFrame(cagrs, index=key_values.index, columns=columns)
+
+
+def _mean_by_ticker(values):
+    # the mean of all the valid values of every ticker, over all the columns
+    valid = values.notnull()
+    total = values.where(valid, 0).sum(axis=1).groupby(level=0).sum()
+    count = valid.sum(axis=1).groupby(level=0).sum()
+    return total / count.where(count > 0)
+
+
+def calculate_panel_valuations(panel, key_values=None, cagrs=None):
+    '''
+    the valuations of stock_analysis.main() for all the tickers of the panel, with the default estimations:
+    growth at normalized P/E, owner earnings (with the ratio to the market cap when the panel has stock prices)
+    and DCF. returns a DataFrame indexed by ticker
+    '''
+    if key_values is None:
+        key_values = calculate_panel_key_values(panel)
+    if cagrs is None:
+        cagrs = calculate_panel_cagrs(key_values)
+    latest = panel.groupby(level=0).tail(1).droplevel(1)
+    latest_key_values = key_values.groupby(level=0).last()
+    valuations = pd.DataFrame(index=latest.index)
+
+    # growth at normalized P/E
+    growth = _mean_by_ticker(cagrs).clip(*GROWTH_RANGE)
+    # the estimations of stock_analysis are whole percents
+    valuations['GrowthEstimation'] = np.trunc(growth)
+    valuations['PEEstimation'] = key_values['P/E'].groupby(level=0).median().clip(lower=MIN_PE) * PE_PREMIUM
+    valuations['NormalizedPE_low'], valuations['NormalizedPE_high'] = \
+        valuation_funcs.calc_growth_at_normalized_PE_array(latest_key_values['EarningPerShare(Diluted)'],
+                                                           valuations['PEEstimation'],
+                                                           valuations['GrowthEstimation'])
+
+    # owner earnings of the latest period
+    valuations['OwnerEarnings'] = valuation_funcs.calc_owner_earnings_array(latest)
+    if 'StockPrice' in latest.columns:
+        market_cap = latest['StockPrice'] * latest['NumberOfShares']
+        valuations['OwnerEarningsRatio'] = OWNER_EARNINGS_YEARS * valuations['OwnerEarnings'] / market_cap
+
+    # DCF, with the growth of the free cash flow when it is known
+    fcf_growth = _mean_by_ticker(cagrs[['FreeCashFlowPerShare(Diluted)']]).clip(*FCF_GROWTH_RANGE)
+    valuations['FCFGrowthEstimation'] = fcf_growth.fillna(growth)
+    valuations['DCF_low'], valuations['DCF_high'] = \
+        valuation_funcs.DCF_FCF_array(latest_key_values['FreeCashFlowPerShare(Diluted)'],
+                                      valuations['FCFGrowthEstimation'])
+    return valuations
+
+
+def analyze_panel(panel):
+    '''
+    the key values, CAGRs and valuations of all the tickers of a panel (see build_panel)
+    '''
+    if 'NumberOfSharesAdjusted' not in panel.columns:
+        panel = add_split_adjusted_shares(panel)
+    key_values = calculate_panel_key_values(panel)
+    cagrs = calculate_panel_cagrs(key_values)
+    valuations = calculate_panel_valuations(panel, key_values, cagrs)
+    return {'key_values': key_values, 'cagrs': cagrs, 'valuations': valuations}
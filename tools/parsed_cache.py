@@ -0,0 +1,56 @@
+# Persistent cache of the results extracted from every XBRL file by tools.xbrl_parser.XBRL.
+# Filings never change once published, so the results of a file are keyed by the hash of its content
+# together with the parser version and the parsing configuration (fields, alternative tag names, DEI usage).
+# Changing config/xbrl_config.py (or bumping PARSER_VERSION) makes all the old entries unreachable.
+
+import os
+import json
+import zlib
+import pickle
+import hashlib
+
+from tools.filing_store import get_content_hash
+
+# bump it whenever a change of the parser changes its results
+PARSER_VERSION = 3
+DEFAULT_CACHE_PATH = os.path.join(os.getcwd(), "SEC-Edgar-Data", "parsed_cache")
+
+
+def get_config_hash(kind, use_dei, tag_names_list, alternative_tag_names, collect_all_facts=False):
+    config = {'parser_version': PARSER_VERSION, 'kind': kind, 'use_dei': use_dei,
+              'tags': list(tag_names_list), 'alternatives': alternative_tag_names,
+              'all_facts': collect_all_facts}
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ParsedFilingCache(object):
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+
+    def __repr__(self):
+        return "ParsedFilingCache(path={0})".format(self.path)
+
+    def get_key(self, xbrl_path, config_hash):
+        return hashlib.sha256((get_content_hash(xbrl_path) + config_hash).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key + '.pkl.z')
+
+    def get(self, key):
+        path = self._entry_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.loads(zlib.decompress(f.read()))
+        except Exception:
+            # a broken entry is simply parsed again
+            return None
+
+    def set(self, key, result):
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.part', 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(path + '.part', path)
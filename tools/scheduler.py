@@ -0,0 +1,173 @@
+# Crawl the filings of a whole universe of tickers in a single job.
+# All the (ticker, form) pairs go into one global priority queue which is consumed by a pool of
+# workers. The workers share the pooled session and the sec.gov rate limiter of tools.transport,
+# and the progress is saved to a checkpoint file so a restarted job skips the work already done.
+#
+# usage example (from the project folder):
+#     python3 -m tools.scheduler --tickers tickers.txt --forms 10-K 10-Q
+
+import os
+import json
+import heapq
+import argparse
+import threading
+from datetime import datetime
+import pandas as pd
+
+from tools import utils
+from tools.crawler import SecCrawler, DEFAULT_DATA_PATH
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(DEFAULT_DATA_PATH, "crawl_checkpoint.json")
+DEFAULT_TICKER_WORKERS = 4
+# lower value is crawled first, yearly reports are the most important for the analysis
+FORM_PRIORITIES = {'10-K': 0, '20-F': 0, '10-Q': 1}
+
+
+def read_tickers(tickers):
+    '''
+    gets a list of tickers or a path to a file with a ticker in every line (or comma separated)
+    '''
+    if isinstance(tickers, str):
+        with open(tickers, 'r') as f:
+            tickers = f.read().replace(',', '\n').split()
+    # remove duplicates but keep the original order
+    return list(dict.fromkeys(ticker.strip().lower() for ticker in tickers if ticker.strip()))
+
+
+class CrawlScheduler(object):
+
+    def __init__(self, tickers, form_types=('10-K', '10-Q'), number_of_documents=40, from_date=None,
+                 doc_type='xbrl', data_path=DEFAULT_DATA_PATH, checkpoint_path=DEFAULT_CHECKPOINT_PATH,
+                 workers=DEFAULT_TICKER_WORKERS, compress=False):
+        self.tickers = read_tickers(tickers)
+        self.form_types = list(form_types)
+        self.number_of_documents = number_of_documents
+        self.from_date = from_date or datetime.today().strftime('%Y%m%d')
+        self.doc_type = doc_type
+        self.data_path = data_path
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.checkpoint = self._load_checkpoint()
+
+    def __repr__(self):
+        return "CrawlScheduler(tickers={0}, form_types={1})".format(len(self.tickers), self.form_types)
+
+    @staticmethod
+    def _job_key(ticker, form_type):
+        return "%s|%s" % (ticker, form_type)
+
+    def _load_checkpoint(self):
+        if not os.path.isfile(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path, 'r') as f:
+            return json.load(f)
+
+    def _save_checkpoint(self):
+        # write to a temporary file and rename it, so a killed job never leaves a broken checkpoint
+        folder = os.path.dirname(self.checkpoint_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.checkpoint, f, indent=1)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _build_queue(self):
+        queue = []
+        for ticker_idx, ticker in enumerate(self.tickers):
+            for form_type in self.form_types:
+                job = self.checkpoint.get(self._job_key(ticker, form_type))
+                if job is not None and job['status'] == 'done':
+                    continue
+                priority = FORM_PRIORITIES.get(form_type, len(FORM_PRIORITIES))
+                queue.append((priority, ticker_idx, ticker, form_type))
+        heapq.heapify(queue)
+        return queue
+
+    def _get_crawler(self):
+        # the crawler keeps the current output folder as a state, so every worker gets its own one
+        if not hasattr(self.local, 'crawler'):
+            self.local.crawler = SecCrawler(self.data_path, compress=self.compress)
+        return self.local.crawler
+
+    def _run_job(self, ticker, form_type):
+        job = {'status': 'failed', 'documents': 0, 'failed': []}
+        try:
+            cik, company_name = utils.get_cik_and_name_from_ticker(ticker)
+            docs, failed = self._get_crawler()._fetch_report(
+                ticker, cik, company_name, self.from_date, self.number_of_documents, form_type, self.doc_type)
+            job['documents'] = len([doc_name for _, doc_name in docs if doc_name not in failed])
+            job['failed'] = failed
+            if len(failed) == 0:
+                job['status'] = 'done'
+        except Exception as e:
+            print("{0} {1} crawl failed: {2}".format(ticker, form_type, str(e)))
+            job['error'] = str(e)
+        job['finished_at'] = datetime.now().isoformat()
+        with self.lock:
+            self.checkpoint[self._job_key(ticker, form_type)] = job
+            self._save_checkpoint()
+
+    def _worker(self, queue):
+        while True:
+            with self.lock:
+                if len(queue) == 0:
+                    return
+                _, _, ticker, form_type = heapq.heappop(queue)
+            self._run_job(ticker, form_type)
+
+    def run(self):
+        '''
+        crawl all the pending jobs, returns a status report with a row per ticker and a column per form
+        '''
+        queue = self._build_queue()
+        print("{0} crawl jobs pending ({1} already done)".format(
+            len(queue), len(self.tickers) * len(self.form_types) - len(queue)))
+        threads = [threading.Thread(target=self._worker, args=(queue,))
+                   for _ in range(min(self.workers, len(queue)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.get_status_report()
+
+    def get_status_report(self):
+        report = pd.DataFrame(index=self.tickers, columns=self.form_types)
+        for ticker in self.tickers:
+            for form_type in self.form_types:
+                job = self.checkpoint.get(self._job_key(ticker, form_type))
+                if job is None:
+                    report.loc[ticker, form_type] = 'pending'
+                elif job['status'] == 'done':
+                    report.loc[ticker, form_type] = 'done (%d)' % job['documents']
+                else:
+                    report.loc[ticker, form_type] = 'failed'
+        return report
+
+
+def crawl_universe(tickers, form_types=('10-K', '10-Q'), **kwargs):
+    '''
+    crawl the filings of many tickers in one job, see CrawlScheduler for the optional arguments
+    '''
+    scheduler = CrawlScheduler(tickers, form_types, **kwargs)
+    report = scheduler.run()
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Crawl the filings of a universe of tickers')
+    parser.add_argument('--tickers', '-t', type=str, nargs='+', required=True,
+                        help='A list of tickers, or a path to a file with a ticker in every line')
+    parser.add_argument('--forms', '-f', type=str, nargs='+', default=['10-K', '10-Q'],
+                        help='Form types to crawl')
+    parser.add_argument('--count', '-n', type=int, default=40,
+                        help='Number of documents to crawl per ticker and form')
+    parser.add_argument('--checkpoint', '-c', type=str, default=DEFAULT_CHECKPOINT_PATH,
+                        help='Path of the checkpoint file')
+    args = parser.parse_args()
+    tickers = args.tickers[0] if len(args.tickers) == 1 and os.path.isfile(args.tickers[0]) else args.tickers
+    crawl_universe(tickers, args.forms, number_of_documents=args.count, checkpoint_path=args.checkpoint)
@@ -0,0 +1,83 @@
+# Streaming splitter for full-text (txt) EDGAR submissions.
+# A submission bundles every document of the filing (the report itself, exhibits, uuencoded graphics,
+# the XBRL instance...) in <DOCUMENT> sections. The splitter reads the submission once, line by line,
+# writes only the documents of the requested types and discards everything else, so memory usage is flat
+# no matter how big the submission is.
+
+import os
+import re
+
+from tools.filing_store import open_filing, REF_SUFFIX
+
+# the XBRL instance is EX-101.INS in older filings, and an extracted XML document in inline XBRL filings
+DEFAULT_KEEP_TYPES = ('EX-101.INS', 'XML')
+# among the XML documents only the instance is kept (not FilingSummary.xml and friends)
+XML_FILENAME_RE = re.compile(r'.*[0-9]\.xml$|.*htm\.xml$', re.IGNORECASE)
+
+
+def _header_value(line, tag):
+    return line[len(tag):].strip().decode('ascii', 'ignore')
+
+
+def split_submission(submission_path, output_folder=None, keep_types=DEFAULT_KEEP_TYPES,
+                     xml_filename_re=XML_FILENAME_RE):
+    '''
+    extract the documents of the requested types out of a full-text submission.
+    every kept document is saved in output_folder (default is the folder of the submission) under its
+    original file name. returns the list of the saved paths
+    '''
+    if output_folder is None:
+        output_folder = os.path.dirname(submission_path)
+    keep_types = set(doc_type.upper() for doc_type in keep_types)
+    saved = []
+    doc_type, file_name, out, in_text = None, None, None, False
+    with open_filing(submission_path) as fh:
+        for line in fh:
+            if not in_text:
+                if line.startswith(b'<DOCUMENT>'):
+                    doc_type, file_name = None, None
+                elif line.startswith(b'<TYPE>'):
+                    doc_type = _header_value(line, b'<TYPE>').upper()
+                elif line.startswith(b'<FILENAME>'):
+                    file_name = os.path.basename(_header_value(line, b'<FILENAME>'))
+                elif line.startswith(b'<TEXT>'):
+                    in_text = True
+                    if doc_type in keep_types and file_name and \
+                            (doc_type != 'XML' or xml_filename_re is None or xml_filename_re.match(file_name)):
+                        out = open(os.path.join(output_folder, file_name + '.part'), 'wb')
+                continue
+
+            if line.startswith(b'</TEXT>'):
+                in_text = False
+                if out is not None:
+                    out.close()
+                    path = os.path.join(output_folder, file_name)
+                    os.replace(path + '.part', path)
+                    saved.append(path)
+                    out = None
+            elif out is not None and not (line.startswith(b'<XBRL>') or line.startswith(b'</XBRL>')):
+                # the <XBRL> wrapper lines are not part of the xml document itself
+                out.write(line)
+    if out is not None:
+        # truncated submission, don't leave a partial document behind
+        out.close()
+        os.remove(out.name)
+    return saved
+
+
+def split_folder(folder, keep_types=DEFAULT_KEEP_TYPES, xml_filename_re=XML_FILENAME_RE, remove_submissions=False):
+    '''
+    offline pass over a folder of downloaded submissions (e.g. SEC-Edgar-Data/<ticker>/10-K/txt)
+    '''
+    saved = []
+    for file in sorted(os.listdir(folder)):
+        if file.endswith(REF_SUFFIX):
+            file = file[:-len(REF_SUFFIX)]
+        if re.match(r'.*[0-9]+\.txt$', file):
+            path = os.path.join(folder, file)
+            extracted = split_submission(path, folder, keep_types, xml_filename_re)
+            saved += extracted
+            # a submission without any of the document types is kept whole
+            if remove_submissions and len(extracted) > 0:
+                os.remove(path if os.path.isfile(path) else path + REF_SUFFIX)
+    return saved
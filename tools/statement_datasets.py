@@ -0,0 +1,307 @@
+# Bulk ingest of the SEC Financial Statement Data Sets (https://www.sec.gov/dera/data/financial-statement-data-sets).
+# Every quarterly zip holds the numbers of all the filings of that quarter, for every filer:
+#     sub.txt - one row per filing (adsh = accession number, cik, form, period, fy...)
+#     num.txt - one row per reported number (adsh, tag, version, ddate, qtrs, uom, coreg / segments, value)
+# num.txt is read from the zip in chunks, and only the non dimensional facts of the configured fields which can
+# still be selected are kept, so memory usage is bounded by the chunk size and the size of the result.
+# The facts are then picked with the same rules as the context selection of XBRL (tools/xbrl_parser.py),
+# and the result is the same per ticker DataFrame as XBRL.get_data_df() (years or quarters x fields).
+# The selection functions work on any table of (adsh, field, rank, ddate, qtrs, value) facts, and are shared
+# with the companyfacts loader (tools/companyfacts.py).
+#
+# usage example:
+#     frames = load_statement_datasets(['2019q1.zip', '2019q2.zip', '2019q3.zip', '2019q4.zip'], tickers=['aapl'])
+
+import csv
+import zipfile
+import numpy as np
+import pandas as pd
+
+from tools import utils
+from tools.xbrl_parser import build_alias_map
+from config.xbrl_config import US_GAPP_TAGS_LIST, ALTERNATIVE_TAG_NAMES
+
+ANNUAL_FORMS = ('10-K', '20-F')
+QUARTERLY_FORMS = ('10-K', '10-Q')
+DEFAULT_CHUNK_SIZE = 500000
+STANDARD_TAXONOMIES = ('us-gaap/', 'dei/')
+DEI_SHARES_TAG = 'EntityCommonStockSharesOutstanding'
+
+# priority of the fact groups of a field inside one filing, like XBRL._find_YTD_data:
+# the field itself in a YTD period, then its alternatives, then the same in the end of year instant
+YTD_PRIMARY, YTD_ALTERNATIVE, Q4_PRIMARY, Q4_ALTERNATIVE = range(4)
+FACT_COLUMNS = ['adsh', 'field', 'rank', 'ddate', 'qtrs', 'value']
+
+
+def _read_table(zf, name, columns, **kwargs):
+    # the data set files are tab separated, without quoting, and not always valid utf-8
+    with zf.open(name) as f:
+        header = f.readline().decode('latin-1').rstrip('\r\n').split('\t')
+    usecols = [column for column in columns if column in header]
+    return pd.read_csv(zf.open(name), sep='\t', usecols=usecols, quoting=csv.QUOTE_NONE,
+                       encoding='latin-1', **kwargs)
+
+
+def read_submissions(zf, ciks=None, forms=ANNUAL_FORMS):
+    '''
+    the filings of the data set, optionally only of the given CIKs (ints) and forms
+    '''
+    sub = _read_table(zf, 'sub.txt', ['adsh', 'cik', 'form', 'period', 'fy'],
+                      dtype={'adsh': str, 'cik': np.int64, 'form': str})
+    sub = sub[sub['form'].isin(forms)]
+    if ciks is not None:
+        sub = sub[sub['cik'].isin(ciks)]
+    sub = sub.dropna(subset=['period'])
+    sub['period'] = pd.to_datetime(sub['period'].astype(np.int64).astype(str), format='%Y%m%d')
+    return sub
+
+
+def iter_numbers(zf, adshs, chunksize=DEFAULT_CHUNK_SIZE):
+    '''
+    yields chunks of num.txt rows of the given filings (set of accession numbers), standard taxonomy tags only
+    '''
+    columns = ['adsh', 'tag', 'version', 'coreg', 'segments', 'ddate', 'qtrs', 'value']
+    chunks = _read_table(zf, 'num.txt', columns, chunksize=chunksize,
+                         dtype={'adsh': str, 'tag': str, 'version': str, 'coreg': str, 'segments': str})
+    for chunk in chunks:
+        chunk = chunk[chunk['adsh'].isin(adshs) & chunk['value'].notna()]
+        chunk = chunk[chunk['version'].str.startswith(STANDARD_TAXONOMIES)]
+        yield chunk
+
+
+def alias_frame(alias_map):
+    rows = [(tag, field, rank) for tag, aliases in alias_map.items() for field, rank in aliases]
+    return pd.DataFrame(rows, columns=['tag', 'field', 'rank'])
+
+
+def _extract_filing_facts(num, aliases):
+    '''
+    the facts of a num.txt chunk that can fill one of the fields, in instant, quarter or YTD (4 quarters) periods
+    '''
+    num = num[num['qtrs'].isin([0, 1, 4])]
+    dimensional = num['coreg'].notna() if 'coreg' in num.columns else False
+    if 'segments' in num.columns:
+        dimensional = dimensional | num['segments'].notna()
+    num = num[~dimensional] if dimensional is not False else num
+    num = num.assign(tag=num['tag'].str.lower())
+    facts = num[['adsh', 'tag', 'ddate', 'qtrs', 'value']].merge(aliases, on='tag')
+    return facts.drop(columns='tag')
+
+
+def _assign_YTD_years(facts, subs, use_dei):
+    '''
+    the YTD and instant facts with their (datetime) end date and the year they are reported for, without the
+    YTD periods which are not used with DEI data
+    '''
+    facts = facts[facts['qtrs'] != 1].merge(subs[['adsh', 'period', 'fy']], on='adsh')
+    ddate = pd.to_datetime(facts['ddate'].astype(np.int64).astype(str), format='%Y%m%d')
+    is_ytd = (facts['qtrs'] == 4).values
+
+    # YTD periods: the year of the end date (or of the start date for years ending in January / February),
+    # with DEI data the fiscal year is counted back from the fiscal year focus of the filing
+    ytd_year = np.where(ddate.dt.month >= 3, ddate.dt.year, ddate.dt.year - 1)
+    if use_dei:
+        same_day = (ddate.dt.month == facts['period'].dt.month) & (ddate.dt.day == facts['period'].dt.day)
+        dei_year = facts['fy'] - (facts['period'].dt.year - ddate.dt.year)
+        use_fy = facts['fy'].notna().values
+        ytd_year = np.where(use_fy, dei_year, ytd_year)
+        is_ytd_kept = is_ytd & (~use_fy | same_day.values)
+    else:
+        is_ytd_kept = is_ytd
+    # end of year instants: the latest instant of the year (January belongs to the previous year),
+    # preferring the end dates of the YTD periods of the filing
+    q4_year = np.where(ddate.dt.month < 2, ddate.dt.year - 1, ddate.dt.year)
+    facts = facts.assign(ddate=ddate, year=np.where(is_ytd, ytd_year, q4_year))
+    return facts[is_ytd_kept | ~is_ytd]
+
+
+def select_YTD_facts(facts, subs, use_dei):
+    '''
+    vectorized equivalent of the context selection of XBRL._parse_YTD_xbrl, for all the filings at once.
+    returns (adsh, field, year, value) rows, at most one per filing, field and year
+    '''
+    facts = _assign_YTD_years(facts, subs, use_dei)
+
+    instants = facts[facts['qtrs'] == 0]
+    ytd_ends = facts.loc[facts['qtrs'] == 4, ['adsh', 'ddate']].drop_duplicates().assign(is_ytd_end=True)
+    candidates = instants[['adsh', 'year', 'ddate']].drop_duplicates().merge(ytd_ends, how='left',
+                                                                             on=['adsh', 'ddate'])
+    candidates['is_ytd_end'] = candidates['is_ytd_end'].fillna(False).astype(bool)
+    q4_dates = candidates.sort_values(['is_ytd_end', 'ddate']).drop_duplicates(['adsh', 'year'], keep='last')
+    instants = instants.merge(q4_dates[['adsh', 'year', 'ddate']], on=['adsh', 'year', 'ddate'])
+    # one YTD period per year, the latest one
+    ytd = facts[facts['qtrs'] == 4]
+    ytd_dates = ytd[['adsh', 'year', 'ddate']].sort_values('ddate').drop_duplicates(['adsh', 'year'], keep='last')
+    ytd = ytd.merge(ytd_dates, on=['adsh', 'year', 'ddate'])
+
+    selected = pd.concat([ytd.assign(group=np.where(ytd['rank'] == 0, YTD_PRIMARY, YTD_ALTERNATIVE)),
+                          instants.assign(group=np.where(instants['rank'] == 0, Q4_PRIMARY, Q4_ALTERNATIVE))],
+                         ignore_index=True)
+    # only the first group which has any data for the field is used
+    best_group = selected.groupby(['adsh', 'field'])['group'].transform('min')
+    selected = selected[selected['group'] == best_group]
+    # within the alternatives the last one found wins, like the overwriting order of XBRL._collect_data
+    selected = selected.sort_values('rank').drop_duplicates(['adsh', 'field', 'year'], keep='last')
+    return selected[['adsh', 'field', 'year', 'value']]
+
+
+def select_latest_Q_facts(facts):
+    '''
+    vectorized equivalent of the context selection of XBRL._parse_quarterly_xbrl: the latest instant and the
+    latest quarter of every filing, keyed (in the year column) by the later of the two dates, as "%d/%m/%Y"
+    '''
+    facts = facts[facts['qtrs'] != 4]
+    facts = facts.assign(ddate=pd.to_datetime(facts['ddate'].astype(np.int64).astype(str), format='%Y%m%d'))
+    latest = facts.groupby(['adsh', 'qtrs'])['ddate'].max().rename('latest').reset_index()
+    facts = facts.merge(latest, on=['adsh', 'qtrs'])
+    facts = facts[facts['ddate'] == facts['latest']]
+    key_dates = facts.groupby('adsh')['ddate'].max().dt.strftime('%d/%m/%Y').rename('year').reset_index()
+    selected = facts.merge(key_dates, on='adsh')
+    # the field itself first, then its alternatives
+    selected = selected.assign(group=(selected['rank'] > 0).astype(np.int64))
+    best_group = selected.groupby(['adsh', 'field'])['group'].transform('min')
+    selected = selected[selected['group'] == best_group]
+    selected = selected.sort_values('rank').drop_duplicates(['adsh', 'field', 'year'], keep='last')
+    return selected[['adsh', 'field', 'year', 'value']]
+
+
+def reduce_YTD_facts(facts, subs, use_dei):
+    '''
+    drops the facts which select_YTD_facts can't select, no matter which facts of the same filings are added later:
+    the YTD facts older than the latest YTD period of their year (one row of every older period is kept, its end
+    date may still be the preferred end of year instant), and the instants older than an instant of their year
+    which is the end of a YTD period
+    '''
+    dated = _assign_YTD_years(facts.assign(row=np.arange(len(facts))), subs, use_dei)
+    is_ytd = (dated['qtrs'] == 4).values
+    latest_ytd = dated['ddate'].where(is_ytd).groupby([dated['adsh'], dated['year']]).transform('max')
+    first_of_period = ~dated.duplicated(['adsh', 'qtrs', 'ddate'])
+    ytd_ends = dated.loc[is_ytd, ['adsh', 'ddate']].drop_duplicates().assign(is_ytd_end=True)
+    is_ytd_end = dated[['adsh', 'ddate']].merge(ytd_ends, how='left', on=['adsh', 'ddate'])['is_ytd_end']
+    is_ytd_end = is_ytd_end.notna().values & ~is_ytd
+    latest_end = dated['ddate'].where(is_ytd_end).groupby([dated['adsh'], dated['year']]).transform('max')
+    keep = np.where(is_ytd, (dated['ddate'] == latest_ytd) | first_of_period,
+                    latest_end.isna() | (dated['ddate'] >= latest_end))
+    return facts.iloc[np.sort(dated['row'].values[keep])]
+
+
+def reduce_latest_Q_facts(facts):
+    '''
+    drops the facts which select_latest_Q_facts can't select: the ones older than the latest instant or quarter
+    of their filing
+    '''
+    facts = facts[facts['qtrs'] != 4]
+    latest = facts.groupby(['adsh', 'qtrs'])['ddate'].transform('max')
+    return facts[facts['ddate'] == latest]
+
+
+def dei_share_counts(dei, subs):
+    '''
+    the NumberOfShares fallback of XBRL._merge_YTD_results: the sum of the outstanding share counts on the cover
+    page of the filing, for its fiscal year focus
+    '''
+    counts = dei.groupby('adsh')['value'].sum().reset_index()
+    counts = counts.merge(subs[['adsh', 'fy']].dropna(), on='adsh')
+    return counts.assign(field='NumberOfShares', year=counts['fy'].astype(np.int64))[['adsh', 'field', 'year',
+                                                                                     'value']]
+
+
+def merge_filings(selected, dei_counts, subs):
+    '''
+    merge the filings of every company from the oldest to the newest, so the newest filing wins
+    '''
+    order = subs[['adsh', 'cik', 'period']].sort_values(['period', 'adsh']).reset_index(drop=True)
+    order['order'] = np.arange(len(order))
+    selected = selected.merge(order, on='adsh')
+    if dei_counts is not None and len(dei_counts) > 0:
+        dei_counts = dei_counts.merge(order, on='adsh')
+        # the cover page count is used only if no older (or the same) filing reported the field for that year
+        shares = selected[selected['field'] == 'NumberOfShares']
+        first_seen = shares.groupby(['cik', 'year'])['order'].min().rename('first_seen').reset_index()
+        dei_counts = dei_counts.merge(first_seen, how='left', on=['cik', 'year'])
+        dei_counts = dei_counts[dei_counts['first_seen'].isna() | (dei_counts['first_seen'] > dei_counts['order'])]
+        selected = pd.concat([selected, dei_counts.drop(columns='first_seen')], ignore_index=True)
+    selected = selected.sort_values('order', kind='mergesort')
+    return selected.drop_duplicates(['cik', 'field', 'year'], keep='last')
+
+
+def to_frames(merged, tag_names_list, kind='YTD'):
+    '''
+    pivot the merged facts to a dict of CIK -> DataFrame like XBRL.get_data_df()
+    '''
+    frames = {}
+    for cik, company in merged.groupby('cik'):
+        data = company.pivot(index='year', columns='field', values='value')
+        if kind == 'YTD':
+            data.index = data.index.astype(np.int64)
+            data = data.sort_index()
+        data = data.reindex(columns=tag_names_list)
+        frames[cik] = data
+    return frames
+
+
+def load_statement_datasets(zip_paths, tickers=None, kind='YTD', forms=None, use_dei=False, extra_tags=[],
+                            chunksize=DEFAULT_CHUNK_SIZE):
+    '''
+    parse the data of many companies out of local Financial Statement Data Sets zip files, in one pass.
+    tickers - the companies to load (default is every company of the sec.gov ticker index)
+    kind - 'YTD' for the yearly data (like XBRL.load_YTD_xbrl_file) or '10Q' for the latest quarter of every
+           filing (like XBRL.load_10Q_xbrl_file)
+    returns a dict of ticker -> DataFrame like XBRL(use_dei, extra_tags).get_data_df() of the company's filings
+    '''
+    if kind not in ('YTD', '10Q'):
+        raise ValueError("kind should be 'YTD' or '10Q'")
+    if forms is None:
+        forms = ANNUAL_FORMS if kind == 'YTD' else QUARTERLY_FORMS
+    ticker_index = utils.load_ticker_index()
+    if tickers is None:
+        tickers = list(ticker_index.keys())
+    tickers_per_cik = {}
+    for ticker in tickers:
+        ticker = ticker.lower()
+        cik, _ = utils.get_cik_and_name_from_ticker(ticker)
+        tickers_per_cik.setdefault(int(cik), []).append(ticker)
+
+    tag_names_list = US_GAPP_TAGS_LIST + list(extra_tags)
+    aliases = alias_frame(build_alias_map(tag_names_list, ALTERNATIVE_TAG_NAMES))
+    dei_tag = DEI_SHARES_TAG.lower()
+    all_subs, all_facts, all_dei = [], [], []
+    for zip_path in zip_paths:
+        with zipfile.ZipFile(zip_path) as zf:
+            subs = read_submissions(zf, list(tickers_per_cik.keys()), forms)
+            adshs = set(subs['adsh'])
+            # the facts which can't be selected are dropped chunk by chunk, so the table of the data set
+            # grows with the size of the result and not with the size of num.txt
+            if kind == 'YTD':
+                reduce_facts = lambda facts: reduce_YTD_facts(facts, subs, use_dei)
+            else:
+                reduce_facts = reduce_latest_Q_facts
+            facts = None
+            for num in iter_numbers(zf, adshs, chunksize):
+                is_dei = num['version'].str.startswith('dei/')
+                chunk_facts = reduce_facts(_extract_filing_facts(num[~is_dei], aliases))
+                facts = chunk_facts if facts is None else reduce_facts(pd.concat([facts, chunk_facts],
+                                                                                 ignore_index=True))
+                if use_dei and kind == 'YTD':
+                    dei = num[is_dei & (num['tag'].str.lower() == dei_tag)]
+                    all_dei.append(dei[['adsh', 'value']])
+            if facts is not None:
+                all_facts.append(facts)
+            all_subs.append(subs)
+
+    subs = pd.concat(all_subs, ignore_index=True).drop_duplicates('adsh')
+    facts = pd.concat(all_facts, ignore_index=True) if len(all_facts) > 0 else None
+    if facts is None or len(facts) == 0:
+        selected = pd.DataFrame(columns=['adsh', 'field', 'year', 'value'])
+    elif kind == 'YTD':
+        selected = select_YTD_facts(facts, subs, use_dei)
+    else:
+        selected = select_latest_Q_facts(facts)
+    dei_counts = dei_share_counts(pd.concat(all_dei, ignore_index=True), subs) if len(all_dei) > 0 else None
+    merged = merge_filings(selected, dei_counts, subs)
+
+    frames = {}
+    for cik, data in to_frames(merged, tag_names_list, kind).items():
+        for ticker in tickers_per_cik.get(cik, []):
+            frames[ticker] = data
+    return frames
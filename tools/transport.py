@@ -0,0 +1,287 @@
+# Shared HTTP layer for all the network calls of the project.
+# A single pooled requests session (keep-alive connections are reused between calls),
+# a token bucket rate limiter for sec.gov and a persistent SQLite response cache with
+# per-endpoint TTLs and ETag / Last-Modified revalidation.
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from config import config
+
+DEFAULT_CACHE_PATH = os.path.join(os.getcwd(), "SEC-Edgar-Data", "http_cache.sqlite")
+
+# sec.gov allows up to 10 requests per second, we keep some margin below it
+MAX_REQUESTS_PER_SECOND = 8
+POOL_SIZE = 16
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+REQUEST_TIMEOUT = 60
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# sec.gov rejects (403) or throttles requests without a descriptive User-Agent (a name and a contact email).
+# set sec_user_agent in config/config.py, or the SEC_USER_AGENT environment variable
+USER_AGENT = os.environ.get('SEC_USER_AGENT') or getattr(config, 'sec_user_agent', None) or \
+    'Value-Investing-Tools admin@example.com'
+
+# time to live (in seconds) of cached responses, the first matching pattern is used.
+# None means that the response never expires, 0 means that it is never cached
+CACHE_TTLS = [
+    (re.compile(r'.*/Archives/edgar/data/'), None),  # published filings never change
+    (re.compile(r'.*/cgi-bin/browse-edgar.*output=xml'), 12 * 3600),  # list of filings of a company
+    (re.compile(r'.*/cgi-bin/browse-edgar'), 30 * 24 * 3600),  # company search page (CIK and name)
+    (re.compile(r'.*simfin\.com/api/v1/info/find-id'), 30 * 24 * 3600),
+    (re.compile(r'.*'), 24 * 3600),
+]
+
+
+class TokenBucket(object):
+    '''
+    thread safe token bucket. every request takes one token, tokens are refilled at a constant rate
+    so the long term request rate never exceeds `rate` requests per second
+    '''
+
+    def __init__(self, rate=MAX_REQUESTS_PER_SECOND, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return "TokenBucket(rate={0}, capacity={1})".format(self.rate, self.capacity)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# a single limiter for all the sec.gov requests in the process
+SEC_RATE_LIMITER = TokenBucket()
+
+
+class ResponseCache(object):
+    '''
+    persistent on-disk cache of GET responses, stored in a single SQLite file
+    '''
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self._connection = None
+
+    def __repr__(self):
+        return "ResponseCache(path={0})".format(self.path)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('''CREATE TABLE IF NOT EXISTS responses (
+                                        url TEXT PRIMARY KEY,
+                                        status INTEGER,
+                                        headers TEXT,
+                                        body BLOB,
+                                        fetched_at REAL)''')
+            self._connection.commit()
+        return self._connection
+
+    def get(self, url):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT status, headers, body, fetched_at FROM responses WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        status, headers, body, fetched_at = row
+        return status, json.loads(headers), body, fetched_at
+
+    def set(self, url, status, headers, body):
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                    (url, status, json.dumps(dict(headers)), body, time.time()))
+            self.connection.commit()
+
+    def touch(self, url):
+        with self.lock:
+            self.connection.execute('UPDATE responses SET fetched_at = ? WHERE url = ?', (time.time(), url))
+            self.connection.commit()
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM responses')
+            self.connection.commit()
+
+
+def _create_session():
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+SESSION = _create_session()
+CACHE = ResponseCache()
+
+
+def set_user_agent(user_agent):
+    '''
+    the User-Agent of all the requests of the shared session, e.g. 'Sample Company Name AdminContact@example.com'
+    '''
+    SESSION.headers['User-Agent'] = user_agent
+
+
+def get_ttl(url):
+    for pattern, ttl in CACHE_TTLS:
+        if pattern.match(url):
+            return ttl
+    return 0
+
+
+def _build_response(url, status, headers, body):
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response._content = body
+    return response
+
+
+def _request(url, rate_limiter=None, **kwargs):
+    '''
+    GET request through the shared session, retries with exponential backoff on throttling (429),
+    server errors and dropped connections
+    '''
+    kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+    for attempt in range(MAX_RETRIES + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            r = SESSION.get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(BACKOFF_FACTOR * 2 ** attempt)
+            continue
+        if r.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+            return r
+        retry_after = r.headers.get('Retry-After')
+        if retry_after is not None and retry_after.isdigit():
+            delay = int(retry_after)
+        else:
+            delay = BACKOFF_FACTOR * 2 ** attempt
+        r.close()
+        time.sleep(delay)
+
+
+def get(url, params=None, headers=None, rate_limiter=None, cache=True, **kwargs):
+    '''
+    GET a url, using the on-disk cache when possible.
+    fresh cached responses are returned without touching the network, expired ones are revalidated
+    with ETag / Last-Modified headers. set cache=False for big documents and streamed downloads
+    '''
+    url = requests.Request('GET', url, params=params).prepare().url
+    headers = dict(headers or {})
+    ttl = get_ttl(url) if cache and not kwargs.get('stream') else 0
+    if ttl == 0:
+        return _request(url, rate_limiter=rate_limiter, headers=headers, **kwargs)
+
+    cached = CACHE.get(url)
+    if cached is not None:
+        status, cached_headers, body, fetched_at = cached
+        if ttl is None or time.time() - fetched_at < ttl:
+            return _build_response(url, status, cached_headers, body)
+        cached_headers = CaseInsensitiveDict(cached_headers)
+        if 'ETag' in cached_headers:
+            headers['If-None-Match'] = cached_headers['ETag']
+        if 'Last-Modified' in cached_headers:
+            headers['If-Modified-Since'] = cached_headers['Last-Modified']
+
+    r = _request(url, rate_limiter=rate_limiter, headers=headers, **kwargs)
+    if r.status_code == 304 and cached is not None:
+        r.close()
+        CACHE.touch(url)
+        return _build_response(url, status, cached_headers, body)
+    if r.status_code == 200:
+        CACHE.set(url, r.status_code, r.headers, r.content)
+    return r
+
+
+def _hash_file(path, hasher):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+
+
+def download(url, path, rate_limiter=None, expected_sha256=None, **kwargs):
+    '''
+    stream a (possibly very big) document to disk with flat memory usage.
+    the data is written to <path>.part and renamed to <path> only once it is complete and validated,
+    so a crashed download never leaves a truncated file behind. an existing .part file is resumed
+    with an HTTP Range request. returns the size and sha256 of the downloaded file
+    '''
+    part_path = path + '.part'
+    extra_headers = kwargs.pop('headers', None)
+    headers = dict(extra_headers or {})
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    if offset > 0:
+        headers['Range'] = 'bytes=%d-' % offset
+
+    r = _request(url, rate_limiter=rate_limiter, headers=headers, stream=True, **kwargs)
+    with r:
+        if r.status_code == 416:
+            # the partial file is not usable (the remote file changed?), start over
+            os.remove(part_path)
+            return download(url, path, rate_limiter, expected_sha256, headers=extra_headers, **kwargs)
+        r.raise_for_status()
+        hasher = hashlib.sha256()
+        if r.status_code == 206:
+            _hash_file(part_path, hasher)
+            mode = 'ab'
+        else:
+            # the server ignored the Range header and sent the whole document
+            offset = 0
+            mode = 'wb'
+        expected_size = None
+        if 'Content-Range' in r.headers and r.headers['Content-Range'].split('/')[-1].isdigit():
+            expected_size = int(r.headers['Content-Range'].split('/')[-1])
+        elif 'Content-Length' in r.headers and 'Content-Encoding' not in r.headers:
+            expected_size = offset + int(r.headers['Content-Length'])
+
+        with open(part_path, mode) as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                hasher.update(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size != expected_size:
+        # keep the partial file so the next attempt can resume it
+        raise IOError('incomplete download of %s: got %d out of %d bytes' % (url, size, expected_size))
+    sha256 = hasher.hexdigest()
+    if expected_sha256 is not None and sha256 != expected_sha256:
+        os.remove(part_path)
+        raise IOError('checksum mismatch for %s' % url)
+    os.replace(part_path, path)
+    return size, sha256
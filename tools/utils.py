@@ -1,7 +1,9 @@
-from tools.crawler import SecCrawler
+from tools.crawler import SecCrawler, DEFAULT_DATA_PATH
+from tools import transport, filing_store
 import re
-import requests
+import json
 import os
+import threading
 import sys
 import pandas as pd
 import numpy as np
@@ -10,6 +12,13 @@ from datetime import datetime, timedelta
 from config.config import WTD_api_key, simfin_api_key
 from ipdb import set_trace
 
+TICKER_INDEX_URL = 'https://www.sec.gov/files/company_tickers.json'
+TICKER_INDEX_PATH = os.path.join(DEFAULT_DATA_PATH, 'company_tickers.json')
+_ticker_index = None
+_ticker_index_lock = threading.Lock()
+# consecutive share counts with a higher ratio are taken as a stock split (assuming that the split is an integer > 2)
+SPLIT_RATIO_THRESHOLD = 1.7
+
 
 def find_and_save_10K_to_folder(ticker, from_date=None, number_of_documents=40, doc_type='xbrl'):
     if from_date is None:
@@ -38,9 +47,53 @@ def find_and_save_20F_to_folder(ticker, from_date=None, number_of_documents=40,
                        number_of_documents, doc_type)
 
 
+def load_ticker_index(path=TICKER_INDEX_PATH, refresh=False):
+    '''
+    load the ticker -> (CIK, company name) index from the bulk mapping file of sec.gov.
+    the file is downloaded only if it is missing or if refresh=True, and it is parsed once per process.
+    if the file can't be downloaded or read, the index loaded so far (or an empty one) is returned and
+    nothing is cached, so the next call tries again and the lookups fall back to EDGAR meanwhile
+    '''
+    global _ticker_index
+    with _ticker_index_lock:
+        if _ticker_index is not None and not refresh:
+            return _ticker_index
+        try:
+            if refresh or not os.path.isfile(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                transport.download(TICKER_INDEX_URL, path, rate_limiter=transport.SEC_RATE_LIMITER)
+            with open(path, 'r') as f:
+                data = json.load(f)
+            ticker_index = {}
+            for item in data.values():
+                ticker_index[item['ticker'].lower()] = ('%010d' % int(item['cik_str']), item['title'])
+        except IOError as e:
+            print('could not download the ticker index: %s' % str(e))
+            return _ticker_index if _ticker_index is not None else {}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print('could not read the ticker index: %s' % str(e))
+            # a broken file would never be downloaded again
+            os.remove(path)
+            return _ticker_index if _ticker_index is not None else {}
+        _ticker_index = ticker_index
+        return _ticker_index
+
+
 def get_cik_and_name_from_ticker(ticker):
+    '''
+    O(1) lookup in the local ticker index. tickers which are missing from the index are
+    looked up on EDGAR once and memoized for the rest of the process
+    '''
+    ticker_index = load_ticker_index()
+    ticker = ticker.lower()
+    if ticker not in ticker_index:
+        ticker_index[ticker] = _scrape_cik_and_name_from_ticker(ticker)
+    return ticker_index[ticker]
+
+
+def _scrape_cik_and_name_from_ticker(ticker):
     URL = 'http://www.sec.gov/cgi-bin/browse-edgar?CIK=%s&Find=Search&owner=exclude&action=getcompany' % ticker
-    data = requests.get(URL).content.decode('utf-8')
+    data = transport.get(URL, rate_limiter=transport.SEC_RATE_LIMITER).content.decode('utf-8')
     CIK_RE = re.compile(r'.*CIK=(\d{10}).*')
     cik_find = CIK_RE.findall(data)
     if type(cik_find) == str:
@@ -64,18 +117,27 @@ def get_cik_and_name_from_ticker(ticker):
     return cik_find, name_find
 
 
-def get_reports_list(ticker, report_type='10-K', file_type='xbrl', data_folder='./SEC-Edgar-Data/'):
+def get_reports_list(ticker, report_type='10-K', file_type='xbrl', data_folder='./SEC-Edgar-Data/', extracted=False):
+    '''
+    the reports of the ticker on disk. with file_type='txt' these are the full-text submissions, or with extracted=True
+    the XBRL instances which were extracted out of them (see tools/sgml.py), never both so no filing is listed twice
+    '''
     report_type += '/'
     path = os.path.join(data_folder, ticker, report_type, file_type)
     if not os.path.isdir(path):
         print(f'could not find {ticker} folder')
         sys.exit()
+    # documents kept in the compressed filing store are listed by their original name,
+    # use filing_store.open_filing to read them
+    names = [f[:-len(filing_store.REF_SUFFIX)] if f.endswith(filing_store.REF_SUFFIX) else f
+             for f in os.listdir(path) if not f.endswith('.part')]
     if file_type == 'xbrl':
-        files = [os.path.join(path, f) for f in os.listdir(
-            path) if re.match(r'.*[0-9]+.xml', f) or re.match(r'.*htm.xml', f)]
+        files = [os.path.join(path, f) for f in names if re.match(r'.*[0-9]+.xml', f) or re.match(r'.*htm.xml', f)]
+    elif file_type == 'txt' and extracted:
+        # xml files in a txt folder are XBRL instances extracted out of the submissions
+        files = [os.path.join(path, f) for f in names if re.match(r'.*[0-9]+.xml', f) or re.match(r'.*htm.xml', f)]
     elif file_type == 'txt':
-        files = [os.path.join(path, f) for f in os.listdir(
-            path) if re.match(r'.*[0-9]+.txt', f)]
+        files = [os.path.join(path, f) for f in names if re.match(r'.*[0-9]+.txt', f)]
 
     return files
 
@@ -89,7 +151,7 @@ def get_historical_stock_price(ticker, years=10, api='simfin'):
     if api == 'WTD':
         request_url = 'https://www.worldtradingdata.com/api/v1/history?symbol=%s&sort=newest&api_token=%s&date_from=%s' % (
             ticker, WTD_api_key, start_date)
-        content = requests.get(request_url)
+        content = transport.get(request_url)
         data = content.json()
         df = pd.DataFrame.from_dict(data['history'], orient='index')
         df.index = pd.to_datetime(df.index)
@@ -97,7 +159,7 @@ def get_historical_stock_price(ticker, years=10, api='simfin'):
     elif api == "simfin":
         request_url = "https://simfin.com/api/v1/info/find-id/ticker/%s?api-key=%s" % (
             ticker, simfin_api_key)
-        content = requests.get(request_url)
+        content = transport.get(request_url)
         data = content.json()
         if "error" in data or len(data) < 1:
             return None
@@ -106,7 +168,7 @@ def get_historical_stock_price(ticker, years=10, api='simfin'):
 
         request_url = "https://simfin.com/api/v1/companies/id/%s/shares/prices?api-key=%s&start=%s" % (
             sim_id, simfin_api_key, start_date)
-        content = requests.get(request_url)
+        content = transport.get(request_url)
         data = content.json()
         df = pd.DataFrame(data['priceData'])
         df.rename(columns={'closeAdj': 'close'}, inplace=True)
@@ -117,19 +179,31 @@ def get_historical_stock_price(ticker, years=10, api='simfin'):
     return df
 
 
+def split_adjustment_multipliers(stock_count, axis=0):
+    '''
+    gets an array of share counts ordered by period along the axis (e.g. years x series, or tickers x quarters with
+    axis=1), and returns the multipliers which adjust every count to the latest period: the reversed cumulative
+    product of the rounded ratios between consecutive counts which look like stock splits
+    '''
+    counts = np.moveaxis(np.asarray(stock_count, dtype=np.float64), axis, -1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = counts[..., 1:] / counts[..., :-1]
+    splits = np.where(ratios > SPLIT_RATIO_THRESHOLD, np.round(ratios), 1.0)
+    multipliers = np.ones(counts.shape)
+    multipliers[..., :-1] = np.cumprod(splits[..., ::-1], axis=-1)[..., ::-1]
+    return np.moveaxis(multipliers, -1, axis)
+
+
 def estimate_stock_split_adjustments(stock_count):
     '''
-    gets a series of stock prices, estimates if there were major stock splits
-    returns an adjusted stock_count
+    gets a series of stock counts, estimates if there were major stock splits
+    returns an adjusted stock_count.
+    a DataFrame adjusts all of its columns (e.g. the basic and the diluted counts) in one pass, and a (ticker, period)
+    MultiIndex (sorted by period within every ticker) adjusts every ticker separately
     '''
-    multiplier = 1
-    counts = stock_count.values
-    adjusted_count = pd.Series(0, index=stock_count.index)
-    adjusted_count.iloc[-1] = counts[-1]
-    for idx, count in reversed(list(enumerate(counts[:-1]))):
-        ratio = stock_count.iloc[idx + 1] / count
-        if ratio > 1.7:  # assuming that the split is an integer > 2
-            multiplier *= np.round(ratio)
-        adjusted_count.iloc[idx] = count * multiplier
-
-    return adjusted_count
+    if isinstance(stock_count.index, pd.MultiIndex):
+        ratios = stock_count.groupby(level=0).shift(-1) / stock_count
+        splits = np.round(ratios).where(ratios > SPLIT_RATIO_THRESHOLD, 1.0)
+        multipliers = splits.iloc[::-1].groupby(level=0).cumprod().iloc[::-1]
+        return stock_count * multipliers
+    return stock_count * split_adjustment_multipliers(stock_count.values, axis=0)
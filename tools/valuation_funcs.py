@@ -2,9 +2,34 @@ import numpy as np
 import pandas as pd
 
 
+def average_with_previous(values, axis=-1):
+    '''
+    the average of every value and the one before it along the axis (a rolling mean of two), nan for the first one
+    '''
+    values = np.moveaxis(np.asarray(values, dtype=np.float64), axis, -1)
+    average = np.full(values.shape, np.nan)
+    average[..., 1:] = (values[..., 1:] + values[..., :-1]) / 2
+    return np.moveaxis(average, -1, axis)
+
+
+def calculate_ROIC_array(operating_income, tax_rate, long_term_debt, current_debt, stockholders_equity, cash,
+                         axis=-1):
+    '''
+    array version of calculate_ROIC (in percents), the years are along the axis, so a whole
+    matrix of tickers x years is a single call. missing debt values are taken as 0
+    '''
+    nopat = np.asarray(operating_income, dtype=np.float64) * (1 - np.asarray(tax_rate, dtype=np.float64))
+    invested_capital = np.nan_to_num(np.asarray(long_term_debt, dtype=np.float64)) + \
+        np.nan_to_num(np.asarray(current_debt, dtype=np.float64)) + \
+        np.asarray(stockholders_equity, dtype=np.float64) - np.asarray(cash, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * nopat / average_with_previous(invested_capital, axis)
+
+
 def calculate_ROIC(data):
     """gets a data frame with the following fields: OperatingIncome, TaxRate, LongTermDebt, CurrentDebt, StockholderEquity and Cash
-        and calculate the ROIC of the company per year
+        and calculate the ROIC of the company per year (in percents)
+        a data frame with a (ticker, year) MultiIndex gives the ROIC of every ticker
     
     Arguments:
         data {pd.Dataframe} -- Dataframe with all needed columns
@@ -13,14 +38,12 @@ def calculate_ROIC(data):
     long_term_debt = data['LongTermDebt'].fillna(0)
     current_debt = data['CurrentDebt'].fillna(0)
     invested_capital = long_term_debt + current_debt + data['StockholdersEquity'] - data['Cash']
-    average_invested_capital = [None]
-    for i in range(len(invested_capital))[1:]:
-        average = (invested_capital.iloc[i] + invested_capital.iloc[i - 1]) / 2
-        average_invested_capital.append(average)
-    
-    roic_values = nopat.divide(average_invested_capital)
-    roic = pd.Series([f"{round(100 * val, 2)}%" for val in roic_values], index=roic_values.index)
-    return roic
+    if isinstance(invested_capital.index, pd.MultiIndex):
+        previous_invested_capital = invested_capital.groupby(level=0).shift(1)
+    else:
+        previous_invested_capital = invested_capital.shift(1)
+    average_invested_capital = (invested_capital + previous_invested_capital) / 2
+    return 100 * nopat.divide(average_invested_capital)
 
 
 def calculate_cagr(start_value, end_value, years):
@@ -30,50 +53,87 @@ def calculate_cagr(start_value, end_value, years):
     return int(np.round(cagr * 100))
 
 
+def calculate_cagr_array(start_values, end_values, years):
+    '''
+    array version of calculate_cagr (in percents, not rounded), nan where the start or the end value is not positive
+    '''
+    start_values = np.asarray(start_values, dtype=np.float64)
+    end_values = np.asarray(end_values, dtype=np.float64)
+    years = np.asarray(years, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cagrs = 100 * (np.power(end_values / start_values, 1 / years) - 1)
+    valid = (start_values > 0) & (end_values > 0) & (years > 0)
+    return np.where(valid, cagrs, np.nan)
+
+
+def calculate_cagrs_to_latest(values, years):
+    '''
+    the CAGR (in percents) from every year to the latest one, along the last axis of values, so a whole
+    matrix of tickers x years is a single call. nan where the start or the latest value is not positive,
+    and for the latest year itself
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    years = np.asarray(years, dtype=np.float64)
+    return calculate_cagr_array(values, values[..., -1:], years[..., -1:] - years)
+
+
 def calculate_cagr_of_time_series(input_series):
     if input_series.index[-1] == 'TTM':
         values = input_series.iloc[:-1]
     else:
         values = input_series
     current_year = values.index[-1]
-    current_value = values.iloc[-1]
-    periods = []
-    cagrs = []
-    for idx, value in enumerate(values.iloc[:-1]):
-        periods.append(current_year - values.index[idx])
-        try:
-            cagr = calculate_cagr(value, current_value, periods[-1])
-            cagrs.append(str(cagr)+"%")
-        except:
-            cagrs.append(None)
-
-    cagrs.append(np.nan)
+    periods = [current_year - year for year in values.index[:-1]]
+    cagrs = calculate_cagrs_to_latest(values.values, values.index.values)
 
     columns = [str(period) + ' years' for period in periods] + ['now']
-    out = pd.DataFrame(columns=columns, index=['value', 'CAGR'])
-    out.loc['value'] = values.values
-    out.loc['CAGR'] = cagrs
-    return out
+    return pd.DataFrame([values.values, cagrs], index=['value', 'CAGR'], columns=columns)
 
 
-def calc_growth_at_normalized_PE(eps_ttm, normalized_pe_estimation, GR_estimation):
+def _geometric_sum(ratio, years):
     '''
-    a nice valuation technique where we predict a fair price for the stock by projecting the stimated growth 
-    values, and then calculate it back (with a discount rate)
+    closed form of sum(ratio ** y for y in 1..years), element wise
+    '''
+    ratio = np.asarray(ratio, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total = ratio * (1 - np.power(ratio, years)) / (1 - ratio)
+    # the closed form is not defined for a ratio of 1 (and loses precision around it)
+    return np.where(np.abs(ratio - 1) < 1e-9, years * np.ones_like(ratio), total)
+
+
+def normalized_PE_value_array(eps_ttm, normalized_pe_estimation, GR_estimation, discount_rate, years):
     '''
-    # calculate 12% dicount rate for 6 years
-    future_eps = eps_ttm * np.power((1 + GR_estimation / 100.0), 6)
-    discounted_eps = future_eps / np.power(1.12, 6)
-    high_value = discounted_eps * normalized_pe_estimation
+    the EPS projected for some years of growth, discounted back and multiplied by the normalized P/E (rates in percents)
+    '''
+    growth_to_discount = (1 + np.asarray(GR_estimation, dtype=np.float64) / 100.0) / \
+        (1 + np.asarray(discount_rate, dtype=np.float64) / 100.0)
+    return np.asarray(eps_ttm, dtype=np.float64) * np.power(growth_to_discount, years) * normalized_pe_estimation
 
-    # calculate 15% dicount rate for 6 years
-    future_eps = eps_ttm * np.power((1 + GR_estimation / 100.0), 5)
-    discounted_eps = future_eps / np.power(1.15, 5)
-    low_value = discounted_eps * normalized_pe_estimation
 
+def calc_growth_at_normalized_PE_array(eps_ttm, normalized_pe_estimation, GR_estimation,
+                                       low_discount_rate=15, high_discount_rate=12, low_years=5, high_years=6):
+    '''
+    array version of calc_growth_at_normalized_PE. all the arguments (rates in percents) broadcast against
+    each other, e.g. EPS of shape (tickers, 1) and growth rates of shape (1, rates) give (tickers, rates) arrays.
+    returns the low and high fair value arrays
+    '''
+    high_value = normalized_PE_value_array(eps_ttm, normalized_pe_estimation, GR_estimation, high_discount_rate,
+                                           high_years)
+    low_value = normalized_PE_value_array(eps_ttm, normalized_pe_estimation, GR_estimation, low_discount_rate,
+                                          low_years)
     return low_value, high_value
 
 
+def calc_growth_at_normalized_PE(eps_ttm, normalized_pe_estimation, GR_estimation):
+    '''
+    a nice valuation technique where we predict a fair price for the stock by projecting the stimated growth 
+    values, and then calculate it back (with a discount rate)
+    '''
+    # 15% discount rate for 5 years (low value) and 12% discount rate for 6 years (high value)
+    low_value, high_value = calc_growth_at_normalized_PE_array(eps_ttm, normalized_pe_estimation, GR_estimation)
+    return float(low_value), float(high_value)
+
+
 def calc_owner_earnings(last_year_data):
     '''
     a valuation technique where we calculate the owner earnings from the buisness operation
@@ -100,7 +160,55 @@ def calc_owner_earnings(last_year_data):
         balance['recievables'] + balance['payable'] - balance['capex']
     
     return owner_earnings
-    
+
+
+def calc_owner_earnings_array(data):
+    '''
+    array version of calc_owner_earnings, data is a DataFrame (or a dict of arrays) of the income statement data
+    of many companies. nan where the net income or the capital expenditure is missing, other missing values are
+    taken as 0
+    '''
+    def field(name):
+        return np.asarray(data[name], dtype=np.float64)
+
+    owner_earnings = field('NetIncomeLoss') + np.nan_to_num(field('IncomeTaxExpenseBenefit')) + \
+        np.nan_to_num(field('DepreciationAndAmortization')) - \
+        np.nan_to_num(field('IncreaseDecreaseInAccountsReceivable')) + \
+        np.nan_to_num(field('IncreaseDecreaseInAccountsPayable')) - field('CapitalExpenditure')
+    return owner_earnings
+
+
+def DCF_accumulated_ratios(growth_rate, discount_rate=12, terminal_growth_rate=4, growth_years=10, terminal_years=10):
+    '''
+    the sum of the discounted cash flows of the two stages, per unit of the latest free cash flow (rates in percents)
+    '''
+    d = np.asarray(discount_rate, dtype=np.float64) / 100
+    g_2_d_ratio = (1 + np.asarray(growth_rate, dtype=np.float64) / 100) / (1 + d)
+    terminal_ratio = (1 + np.asarray(terminal_growth_rate, dtype=np.float64) / 100) / (1 + d)
+    # the terminal stage starts from the cash flow of the last year of the growth stage
+    return _geometric_sum(g_2_d_ratio, growth_years) + \
+        np.power(g_2_d_ratio, growth_years) * _geometric_sum(terminal_ratio, terminal_years)
+
+
+def DCF_FCF_array(latest_fcf, growth_rate=20, discount_rate=12, terminal_growth_rate=4, growth_years=10,
+                  terminal_years=10):
+    '''
+    array version of DCF_FCF, with the sums of the two stages in closed form (geometric series).
+    all the arguments (rates in percents) broadcast against each other, so a sensitivity grid is a single call,
+    e.g. FCF of shape (tickers, 1, 1), growth rates of shape (1, n, 1) and discount rates of shape (1, 1, m)
+    give (tickers, n, m) arrays. non positive FCF values give nan.
+    returns the low and high DCF arrays
+    '''
+    latest_fcf = np.asarray(latest_fcf, dtype=np.float64)
+    growth_rate = np.asarray(growth_rate, dtype=np.float64)
+    fcf = np.where(latest_fcf > 0, latest_fcf, np.nan)
+    high_DCF = fcf * DCF_accumulated_ratios(growth_rate, discount_rate, terminal_growth_rate, growth_years,
+                                            terminal_years)
+    # do a lower estimation with slower growth rate
+    low_DCF = fcf * DCF_accumulated_ratios(np.maximum(5, growth_rate / 2), discount_rate, terminal_growth_rate,
+                                           growth_years, terminal_years)
+    return low_DCF, high_DCF
+
 
 def DCF_FCF(latest_fcf, growth_rate=20):
     '''
@@ -112,36 +220,6 @@ def DCF_FCF(latest_fcf, growth_rate=20):
     '''
     if latest_fcf <= 0:
         return None, None
-    
-    growth_rate /= 100  # change percents to fractions
-    d = 0.12  # Discount rate
-    terminal_growth_rate = 0.04
-    y1 = 10  # years at high growth rate
-    y2 = 10  # years  at the terminal stage
-    accumulated_ratios = 0
-    for y in range(y1+1)[1:]:
-        g_2_d_ratio = np.power((1 + growth_rate) / (1 + d), y)
-        accumulated_ratios += g_2_d_ratio
-    
-    for y in range(y2+1)[1:]:
-        terminal_ratio = np.power((1 + terminal_growth_rate) / (1 + d), y)
-        accumulated_ratios += g_2_d_ratio * terminal_ratio
-
-    high_DCF = latest_fcf * accumulated_ratios
-
-    # do a lower estimation with slower growth rate
-    low_growth_rate = max(0.05, growth_rate / 2)
-    accumulated_ratios = 0
-    for y in range(y1+1)[1:]:
-        g_2_d_ratio = np.power((1 + low_growth_rate) / (1 + d), y)
-        accumulated_ratios += g_2_d_ratio
-    
-    for y in range(y2+1)[1:]:
-        terminal_ratio = np.power((1 + terminal_growth_rate) / (1 + d), y)
-        accumulated_ratios += g_2_d_ratio * terminal_ratio
-
-    low_DCF = latest_fcf * accumulated_ratios
-
-    return low_DCF, high_DCF
-
-
+    # 12% discount rate, 10 years of growth and 10 years at a 4% terminal growth rate
+    low_DCF, high_DCF = DCF_FCF_array(latest_fcf, growth_rate)
+    return float(low_DCF), float(high_DCF)
@@ -1,81 +1,146 @@
-# from lxml import etree
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree
 from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
 from ipdb import set_trace
 
+from tools.filing_store import open_filing
+from tools.parsed_cache import ParsedFilingCache, get_config_hash
+from tools.fact_table import FactTable, FactTableBuilder
+from tools import filing_planner
 from config.xbrl_config import US_GAPP_TAGS_LIST, ALTERNATIVE_TAG_NAMES
 
 
-class XBRL:
+def build_alias_map(tag_names_list, alternative_tag_names):
+    '''
+    reverse map of (lower case) us-gaap concept name -> list of (field, rank) it can fill,
+    rank 0 is the field itself and rank i is the i-th alternative tag name of the field
+    '''
+    alias_map = {}
+    for field in tag_names_list:
+        alias_map.setdefault(field.lower(), []).append((field, 0))
+        alt_tag_names = alternative_tag_names.get(field, [])
+        if type(alt_tag_names) is not list:
+            alt_tag_names = [alt_tag_names]
+        for rank, alt_tag_name in enumerate(alt_tag_names, 1):
+            alias_map.setdefault(alt_tag_name.lower(), []).append((field, rank))
+    return alias_map
+
+
+DEFAULT_ALIAS_MAP = build_alias_map(US_GAPP_TAGS_LIST, ALTERNATIVE_TAG_NAMES)
+# below this number of files the start of a process pool and the pickling of the results cost more than
+# the parse itself, so load_many parses them in process unless the number of workers is given
+PARALLEL_MIN_FILES = 16
+
+
+class Context(object):
+    '''
+    compact record of a single context of the document
+    '''
+    __slots__ = ('id', 'startdate', 'enddate', 'instant', 'days', 'has_dimensions')
+
+    def __init__(self, context_id, has_dimensions=False):
+        self.id = context_id
+        self.startdate = None
+        self.enddate = None
+        self.instant = None
+        self.days = None
+        self.has_dimensions = has_dimensions
+
+    def __repr__(self):
+        return "Context(id={0}, startdate={1}, enddate={2}, instant={3})".format(
+            self.id, self.startdate, self.enddate, self.instant)
+
 
-    def __init__(self, use_dei=False, extra_tags=[]):
+class XBRL:
 
+    def __init__(self, use_dei=False, extra_tags=[], engine='soup', use_cache=True, cache_path=None,
+                 collect_all_facts=False):
+        '''
+        engine - 'soup' builds a BeautifulSoup DOM of every file, 'lxml' parses the file in a single
+                 streaming iterparse pass and keeps only the contexts and the us-gaap / dei facts
+        use_cache - keep the results of every parsed file in a persistent cache (see tools/parsed_cache.py),
+                    so files which were already parsed are not parsed again
+        collect_all_facts - also extract every numeric fact of the files (not only the configured fields)
+                            into a FactTable, see get_fact_table()
+        '''
+        if engine not in ('soup', 'lxml'):
+            raise ValueError("engine should be 'soup' or 'lxml'")
+        self.engine = engine
         self.data = {}
+        # built lazily by get_data_df(), once all the files were loaded
+        self.data_df = None
+        self.use_dei = use_dei
+        self.extra_tags = list(extra_tags)
+        self.use_cache = use_cache
+        self.cache_path = cache_path
+        self.collect_all_facts = collect_all_facts
+        self.fact_tables = []
+        self.cache = None
+        if use_cache:
+            self.cache = ParsedFilingCache(cache_path) if cache_path is not None else ParsedFilingCache()
+        self._reset_file_state()
+        # default fields that are parsed from XBRL file, and additional tags selected by user
+        # (copied, so the module level list is not modified)
+        self.us_gaap_tag_names_list = US_GAPP_TAGS_LIST + list(extra_tags)
+        self.alternative_tag_names = ALTERNATIVE_TAG_NAMES
+        if len(extra_tags) > 0:
+            self.alias_map = build_alias_map(self.us_gaap_tag_names_list, self.alternative_tag_names)
+        else:
+            self.alias_map = DEFAULT_ALIAS_MAP
+
+    def __str__(self):
+        return str(self.data)
+
+    def _reset_file_state(self):
+        '''
+        every file is parsed on its own, starting from the default contexts
+        '''
+        self.file_data = {}
         self.YTD_contexts = {}
         self.Q4_contexts = {}
         self.Q4_dates = set()
         self.latestQ_context = {}
-        self.use_dei = use_dei
+        self.document_end_date = None
+        self.currentFY = None
+        self.latest_stock_count = None
 
         # set some default contexts
         for year in range(2010, datetime.now().year+1):
             self.YTD_contexts['FD%dQ4YTD' % year] = year
             self.Q4_contexts['FI%dQ4' % year] = year
-        # default fields that are parsed from XBRL file
-        self.us_gaap_tag_names_list = US_GAPP_TAGS_LIST
-        self.alternative_tag_names = ALTERNATIVE_TAG_NAMES
-
-        # Add additional tags selected by user
-        self.us_gaap_tag_names_list += extra_tags
-
-    def __str__(self):
-        return str(self.data)
 
     def _find_YTD_contexts(self):
         '''
         find contexts of YTD periods. usually the general contexts will have the shortest
         name string in every period. this is what we are looking for.
         '''
-        all_context_tags = self.raw_data.find_all(
-            name=re.compile("context", re.IGNORECASE | re.MULTILINE))
         YTD_contexts = {}
-        for tag in all_context_tags:
-            for inner_tag in tag.find_all():
-                # cleaning the inner tags
-                name = inner_tag.name
-                if ':' in name:
-                    name = name.split(':')[-1]
-                inner_tag.name = name.lower()
-            startdate = tag.find('startdate')
-            enddate = tag.find('enddate')
-            if startdate is not None:
-                startdate = re.sub("[^0-9]", "", startdate.text)
-                startdate = datetime.strptime(startdate, "%Y%m%d")
-                enddate = re.sub("[^0-9]", "", enddate.text)
-                enddate = datetime.strptime(enddate, "%Y%m%d")
-                tdelta = enddate - startdate
-                if tdelta.days > 360 and "us-gaap" not in tag.attrs['id']:
-                    if self.use_dei and self.currentFY is not None:
-                        if enddate.month == self.document_end_date.month and enddate.day == self.document_end_date.day:
-                            delta_years = self.document_end_date.year - enddate.year
-                            year = self.currentFY - delta_years
-                        else:
-                            continue
-                    elif enddate.month >= 3:
-                        # If we don't use DEI data we take a rule of thumb of common year-end months
-                        year = enddate.year
-                    else:
-                        year = startdate.year
-                    # take the shortest context ID as the main YTD context
-                    if year not in YTD_contexts.keys():
-                        YTD_contexts[year] = tag.attrs['id']
+        for context in self.duration_contexts:
+            if context.days > 360 and "us-gaap" not in context.id:
+                startdate, enddate = context.startdate, context.enddate
+                if self.use_dei and self.currentFY is not None:
+                    if enddate.month == self.document_end_date.month and enddate.day == self.document_end_date.day:
+                        delta_years = self.document_end_date.year - enddate.year
+                        year = self.currentFY - delta_years
                     else:
-                        if len(tag.attrs['id']) < len(YTD_contexts[year]):
-                            YTD_contexts[year] = tag.attrs['id']
-                    # the end date of the year might assist in finding the last quarter contexts later on
-                    self.Q4_dates.add(enddate)
+                        continue
+                elif enddate.month >= 3:
+                    # If we don't use DEI data we take a rule of thumb of common year-end months
+                    year = enddate.year
+                else:
+                    year = startdate.year
+                # take the shortest context ID as the main YTD context
+                if year not in YTD_contexts.keys():
+                    YTD_contexts[year] = context.id
+                else:
+                    if len(context.id) < len(YTD_contexts[year]):
+                        YTD_contexts[year] = context.id
+                # the end date of the year might assist in finding the last quarter contexts later on
+                self.Q4_dates.add(enddate)
         # flip the keys and values for later use
         for year in YTD_contexts.keys():
             self.YTD_contexts[YTD_contexts[year]] = year
@@ -84,44 +149,32 @@ class XBRL:
         '''
         Find context of end-of-year qurters contexts that represent the state at the end of the year
         '''
-        all_context_tags = self.raw_data.find_all(
-            name=re.compile("context", re.IGNORECASE | re.MULTILINE))
         Q4_contexts = {}
         Q4_dates_per_year = {}
-        for tag in all_context_tags:
-            for inner_tag in tag.find_all():
-                 # cleaning the inner tags
-                name = inner_tag.name
-                if ':' in name:
-                    name = name.split(':')[-1]
-                inner_tag.name = name.lower()
-
-            period = tag.find(re.compile('period'))
-            if period.instant is not None:
-                date = re.sub("[^0-9]", "", period.instant.text)
-                date = datetime.strptime(date, '%Y%m%d')
-                year = date.year
-                month = date.month
-                # looking for the latest quarter in each year, sometimes Q4 can end on 1st month of next year
-                if month < 2:
-                    year -= 1
-                # year = str(year)
-                if year not in Q4_dates_per_year.keys():
-                    Q4_dates_per_year[year] = date
-                    Q4_contexts[year] = tag.attrs['id']
-                elif date in self.Q4_dates and len(tag.attrs['id']) <= len(Q4_contexts[year]):
-                    Q4_dates_per_year[year] = date
-                    Q4_contexts[year] = tag.attrs['id']
-                elif date >= Q4_dates_per_year[year] and len(tag.attrs['id']) < len(Q4_contexts[year]):
-                    Q4_dates_per_year[year] = date
-                    Q4_contexts[year] = tag.attrs['id']
-
-                # TODO - this is an ugly ugly workaround.... need to think of something better
-                if 8 < len(tag.attrs['id']) * 2 < len(Q4_contexts[year]):
-                    # sometimes there are context from a late date which are not meaningful
-                    # they will usualy have a long id name
-                    Q4_dates_per_year[year] = date
-                    Q4_contexts[year] = tag.attrs['id']
+        for context in self.instant_contexts:
+            date = context.instant
+            year = date.year
+            month = date.month
+            # looking for the latest quarter in each year, sometimes Q4 can end on 1st month of next year
+            if month < 2:
+                year -= 1
+            # year = str(year)
+            if year not in Q4_dates_per_year.keys():
+                Q4_dates_per_year[year] = date
+                Q4_contexts[year] = context.id
+            elif date in self.Q4_dates and len(context.id) <= len(Q4_contexts[year]):
+                Q4_dates_per_year[year] = date
+                Q4_contexts[year] = context.id
+            elif date >= Q4_dates_per_year[year] and len(context.id) < len(Q4_contexts[year]):
+                Q4_dates_per_year[year] = date
+                Q4_contexts[year] = context.id
+
+            # TODO - this is an ugly ugly workaround.... need to think of something better
+            if 8 < len(context.id) * 2 < len(Q4_contexts[year]):
+                # sometimes there are context from a late date which are not meaningful
+                # they will usualy have a long id name
+                Q4_dates_per_year[year] = date
+                Q4_contexts[year] = context.id
 
         # flip the keys and values for later use
         for year in Q4_contexts.keys():
@@ -131,142 +184,141 @@ class XBRL:
         '''
         Find context of end-of-year qurters contexts that represent the state at the end of the year
         '''
-        all_context_tags = self.raw_data.find_all(
-            name=re.compile("context", re.IGNORECASE | re.MULTILINE))
         # initialize the context name and date with unreasonable values
         latest_instant_context = 'a'*999
         latest_period_context = 'a'*999
         latest_instant_date = datetime.strptime('19481128', '%Y%m%d')
         latest_enddate = datetime.strptime('19481128', '%Y%m%d')
-        for tag in all_context_tags:
-            for inner_tag in tag.find_all():
-                 # cleaning the inner tags
-                name = inner_tag.name
-                if ':' in name:
-                    name = name.split(':')[-1]
-                inner_tag.name = name.lower()
-
-            period = tag.find(re.compile('period'))
-            startdate = tag.find('startdate')
-            enddate = tag.find('enddate')
-
-            if period.instant is not None:
-                date = re.sub("[^0-9]", "", period.instant.text)
-                current_date = datetime.strptime(date, '%Y%m%d')
-                # set_trace()
-                if current_date >= latest_instant_date:
-                    if len(tag.attrs['id']) <= len(latest_instant_context) or current_date > latest_instant_date:
-                        latest_instant_context = tag.attrs['id']
-                        latest_instant_date = current_date
-                        continue
-
-                # TODO - this is an ugly ugly workaround.... need to think of something better
-                if 8 < len(tag.attrs['id']) * 2 < len(latest_instant_context):
-                    # sometimes there are context from a late date which are not meaningful
-                    # they will usualy have a long id name
-                    latest_instant_context = tag.attrs['id']
+        for context in self.instant_contexts:
+            current_date = context.instant
+            if current_date >= latest_instant_date:
+                if len(context.id) <= len(latest_instant_context) or current_date > latest_instant_date:
+                    latest_instant_context = context.id
                     latest_instant_date = current_date
                     continue
 
-            if startdate is not None:
-                startdate = datetime.strptime(
-                    re.sub("[^0-9]", "", startdate.text), '%Y%m%d')
-                enddate = datetime.strptime(
-                    re.sub("[^0-9]", "", enddate.text), '%Y%m%d')
-                tdelta = enddate - startdate
+            # TODO - this is an ugly ugly workaround.... need to think of something better
+            if 8 < len(context.id) * 2 < len(latest_instant_context):
+                # sometimes there are context from a late date which are not meaningful
+                # they will usualy have a long id name
+                latest_instant_context = context.id
+                latest_instant_date = current_date
 
-                if 35 < tdelta.days < 100 and enddate > latest_enddate:
-                    if len(tag.attrs['id']) <= len(latest_period_context):
-                        latest_period_context = tag.attrs['id']
-                        latest_enddate = enddate
+        for context in self.duration_contexts:
+            if 35 < context.days < 100 and context.enddate > latest_enddate:
+                if len(context.id) <= len(latest_period_context):
+                    latest_period_context = context.id
+                    latest_enddate = context.enddate
 
         date = max(latest_enddate, latest_instant_date).strftime("%d/%m/%Y")
         self.latestQ_context = {
             latest_instant_context: date, latest_period_context: date}
 
-    def _find_us_gaap_tags(self, tag_name):
-        tag_name = tag_name.lower()
-        if len(tag_name) > 8:
-            if tag_name[:8] != "us-gaap:":
-                tag_name = "us-gaap:" + tag_name
-        else:
-            tag_name = "us-gaap:" + tag_name
-        return self.raw_data.find_all(tag_name)
+    def _build_context_table(self):
+        '''
+        parse all the contexts of the document once. the selectors above only scan the
+        instant contexts or the duration contexts of this table
+        '''
+        dates = {}
+
+        def parse_date(text):
+            if text not in dates:
+                digits = re.sub("[^0-9]", "", text)
+                dates[text] = datetime(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+            return dates[text]
+
+        self.context_table = []
+        self.instant_contexts = []
+        self.duration_contexts = []
+        for context_id, startdate, enddate, instant, has_dimensions in self._iter_contexts():
+            context = Context(context_id, has_dimensions)
+            if instant is not None:
+                context.instant = parse_date(instant)
+                self.instant_contexts.append(context)
+            elif startdate is not None:
+                context.startdate = parse_date(startdate)
+                context.enddate = parse_date(enddate)
+                context.days = (context.enddate - context.startdate).days
+                self.duration_contexts.append(context)
+            self.context_table.append(context)
+
+    def _iter_contexts(self):
+        '''
+        yields (id, startdate, enddate, instant, has dimensions) of every context in the document,
+        dates are raw strings (or None)
+        '''
+        if self.engine == 'lxml':
+            for context in self.contexts:
+                yield context
+            return
+        all_context_tags = self.raw_data.find_all(
+            name=re.compile("context", re.IGNORECASE | re.MULTILINE))
+        for tag in all_context_tags:
+            for inner_tag in tag.find_all():
+                # cleaning the inner tags
+                name = inner_tag.name
+                if ':' in name:
+                    name = name.split(':')[-1]
+                inner_tag.name = name.lower()
+            period = tag.find(re.compile('period'))
+            startdate = tag.find('startdate')
+            enddate = tag.find('enddate')
+            instant = period.instant if period is not None else None
+            has_dimensions = tag.find('segment') is not None or tag.find('scenario') is not None
+            yield (tag.attrs['id'],
+                   startdate.text if startdate is not None else None,
+                   enddate.text if enddate is not None else None,
+                   instant.text if instant is not None else None,
+                   has_dimensions)
+
+    def _find_tags(self, tag_name):
+        '''
+        returns a list of (context ref, value) of all the facts of a fully qualified tag name (like dei:documenttype)
+        '''
+        return list(self.facts.get(tag_name, {}).items())
 
-    def _find_YTD_data(self, tag_name, allow_Q4_data=True):
-        if tag_name not in self.data.keys():
-            self.data[tag_name] = {}
-        tags = self._find_us_gaap_tags(tag_name)
+    def _build_fact_index(self):
+        '''
+        bucket the us-gaap facts of the document by the field they can fill (using the reverse alias map),
+        fact_index[field][rank] is a dict of context -> value, where rank 0 is the field itself and
+        rank i is its i-th alternative tag name
+        '''
+        self.fact_index = {}
+        for tag_name, facts in self.facts.items():
+            if not tag_name.startswith('us-gaap:'):
+                continue
+            for field, rank in self.alias_map.get(tag_name[8:], ()):
+                self.fact_index.setdefault(field, {})[rank] = facts
+
+    def _collect_data(self, tag_name, ranks, contexts):
         found = False
-        for tag in tags:
-            context = tag.attrs['contextref']
-            if context in self.YTD_contexts.keys():
-                year = self.YTD_contexts[context]
-                self.data[tag_name][year] = float(tag.text)
-                found = True
-
-        if not found and tag_name in self.alternative_tag_names.keys():
-            alt_tag_names = self.alternative_tag_names[tag_name]
-            if type(alt_tag_names) is not list:
-                alt_tag_names = [alt_tag_names]
-            for alt_tag_name in alt_tag_names:
-                alt_tag_name = "us-gaap:" + alt_tag_name.lower()
-                alt_tags = self._find_us_gaap_tags(alt_tag_name)
-                for tag in alt_tags:
-                    context = tag.attrs['contextref']
-                    if context in self.YTD_contexts.keys():
-                        year = self.YTD_contexts[context]
-                        self.data[tag_name][year] = float(tag.text)
-                        found = True
-
-        if not found and allow_Q4_data:
-            for tag in tags:
-                context = tag.attrs['contextref']
-                if context in self.Q4_contexts.keys():
-                    year = self.Q4_contexts[context]
-                    self.data[tag_name][year] = float(tag.text)
+        field_facts = self.fact_index.get(tag_name, {})
+        for rank in ranks:
+            for context, value in field_facts.get(rank, {}).items():
+                if context in contexts:
+                    self.file_data[tag_name][contexts[context]] = float(value)
                     found = True
+        return found
 
-        # TO DO - this copied block of code is not very elegant, need to think of a different approach
-        if not found and allow_Q4_data and tag_name in self.alternative_tag_names.keys():
-            alt_tag_names = self.alternative_tag_names[tag_name]
-            if type(alt_tag_names) is not list:
-                alt_tag_names = [alt_tag_names]
-            for alt_tag_name in alt_tag_names:
-                alt_tag_name = "us-gaap:" + alt_tag_name.lower()
-                alt_tags = self._find_us_gaap_tags(alt_tag_name)
-                for tag in alt_tags:
-                    context = tag.attrs['contextref']
-                    if context in self.Q4_contexts.keys():
-                        year = self.Q4_contexts[context]
-                        self.data[tag_name][year] = float(tag.text)
-                        found = True
+    def _find_YTD_data(self, tag_name, allow_Q4_data=True):
+        if tag_name not in self.file_data.keys():
+            self.file_data[tag_name] = {}
+        alternative_ranks = sorted(rank for rank in self.fact_index.get(tag_name, {}) if rank > 0)
+        found = self._collect_data(tag_name, [0], self.YTD_contexts)
+        if not found:
+            found = self._collect_data(tag_name, alternative_ranks, self.YTD_contexts)
+        if not found and allow_Q4_data:
+            found = self._collect_data(tag_name, [0], self.Q4_contexts)
+        if not found and allow_Q4_data:
+            found = self._collect_data(tag_name, alternative_ranks, self.Q4_contexts)
 
     def _find_latest_Q_data(self, tag_name):
-        if tag_name not in self.data.keys():
-            self.data[tag_name] = {}
-        tags = self._find_us_gaap_tags(tag_name)
-        found = False
-        for tag in tags:
-            context = tag.attrs['contextref']
-            if context in self.latestQ_context.keys():
-                date = self.latestQ_context[context]
-                self.data[tag_name][date] = float(tag.text)
-                found = True
-
-        if not found and tag_name in self.alternative_tag_names.keys():
-            alt_tag_names = self.alternative_tag_names[tag_name]
-            if type(alt_tag_names) is not list:
-                alt_tag_names = [alt_tag_names]
-            for alt_tag_name in alt_tag_names:
-                alt_tag_name = "us-gaap:" + alt_tag_name.lower()
-                tags = self._find_us_gaap_tags(alt_tag_name)
-                for tag in tags:
-                    context = tag.attrs['contextref']
-                    if context in self.latestQ_context.keys():
-                        date = self.latestQ_context[context]
-                        self.data[tag_name][date] = float(tag.text)
-                        found = True
+        if tag_name not in self.file_data.keys():
+            self.file_data[tag_name] = {}
+        alternative_ranks = sorted(rank for rank in self.fact_index.get(tag_name, {}) if rank > 0)
+        found = self._collect_data(tag_name, [0], self.latestQ_context)
+        if not found:
+            found = self._collect_data(tag_name, alternative_ranks, self.latestQ_context)
 
     def find_dei_info(self):
         # tags = self.raw_data.find_all('dei:CurrentFiscalYearEndDate'.lower())
@@ -276,25 +328,25 @@ class XBRL:
         self.currentFY = None
         self.latest_stock_count = None
         try:
-            tags = self.raw_data.find_all('dei:DocumentPeriodEndDate'.lower())
-            self.document_end_date = tags[0].text
+            tags = self._find_tags('dei:DocumentPeriodEndDate'.lower())
+            self.document_end_date = tags[0][1]
             self.document_end_date = datetime.strptime(
                 self.document_end_date, '%Y-%m-%d')
 
-            tags = self.raw_data.find_all(
+            tags = self._find_tags(
                 'dei:DocumentFiscalYearFocus'.lower())
-            self.currentFY = int(tags[0].text)
-            context_ref = tags[0].attrs['contextref']
+            self.currentFY = int(tags[0][1])
+            context_ref = tags[0][0]
             self.YTD_contexts[context_ref] = self.currentFY
         except:
             pass
 
         try:
-            tags = self.raw_data.find_all(
+            tags = self._find_tags(
                 'dei:EntityCommonStockSharesOutstanding'.lower())
             self.latest_stock_count = 0
-            for tag in tags:
-                self.latest_stock_count += int(tag.text)
+            for _, value in tags:
+                self.latest_stock_count += int(value)
         except:
             pass
 
@@ -304,6 +356,8 @@ class XBRL:
         '''
         if self.use_dei:
             self.find_dei_info()
+        self._build_context_table()
+        self._build_fact_index()
         self._find_YTD_contexts()
         self._find_endyearQ_contexts()
         for tag_name in self.us_gaap_tag_names_list:
@@ -313,44 +367,267 @@ class XBRL:
         '''
         parse the xml and find data of all the predefined field in YTD contexts
         '''
+        self._build_context_table()
+        self._build_fact_index()
         self._find_latestQ_context()
         for tag_name in self.us_gaap_tag_names_list:
             self._find_latest_Q_data(tag_name)
 
-    def load_YTD_xbrl_file(self, xbrl_path):
+    def _iterparse_xbrl_file(self, fh):
         '''
-        parse and load yearly reports (10-K or 20-F)
-        will update the data summary and dataframe
-        can add additional file on top of existing one, but notice that self.raw_data will get overwritten
+        single streaming pass over the document. keeps the contexts and the us-gaap / dei facts
+        (keyed like the soup tag names, e.g. us-gaap:revenues) and frees every element once it was read
         '''
-        with open(xbrl_path, 'r') as fh:
+        self.contexts = []
+        self.facts = {}
+        for _, elem in etree.iterparse(fh, events=('end',), huge_tree=True):
+            parent = elem.getparent()
+            # only the direct children of the root are handled, their inner elements are read from them
+            if parent is None or parent.getparent() is not None or not isinstance(elem.tag, str):
+                continue
+            namespace, _, name = elem.tag[1:].partition('}') if elem.tag[0] == '{' else ('', '', elem.tag)
+            if name == 'context':
+                period = {}
+                for inner in elem.iter():
+                    if isinstance(inner.tag, str):
+                        period[etree.QName(inner).localname.lower()] = inner.text
+                has_dimensions = 'segment' in period or 'scenario' in period
+                self.contexts.append((elem.get('id'), period.get('startdate'),
+                                      period.get('enddate'), period.get('instant'), has_dimensions))
+            elif 'contextRef' in elem.attrib:
+                if 'fasb.org/us-gaap' in namespace or elem.prefix == 'us-gaap':
+                    prefix = 'us-gaap'
+                elif 'xbrl.sec.gov/dei' in namespace or elem.prefix == 'dei':
+                    prefix = 'dei'
+                else:
+                    prefix = None
+                if prefix is not None:
+                    tag_name = prefix + ':' + name.lower()
+                    self.facts.setdefault(tag_name, {})[elem.get('contextRef')] = elem.text or ''
+                if self.fact_builder is not None and 'unitRef' in elem.attrib:
+                    concept = (prefix or elem.prefix or '') + ':' + name.lower()
+                    self.fact_builder.add(concept, elem.get('contextRef'), elem.get('unitRef'),
+                                          elem.get('decimals'), elem.text)
+            elem.clear()
+            while elem.getprevious() is not None:
+                del parent[0]
+
+    def _read_xbrl_file(self, xbrl_path):
+        self.fact_builder = FactTableBuilder(xbrl_path) if self.collect_all_facts else None
+        with open_filing(xbrl_path) as fh:
+            if self.engine == 'lxml':
+                self._iterparse_xbrl_file(fh)
+                return
             self.raw_data = BeautifulSoup(fh, "lxml")
 
+        # single pass over the document, keeping the us-gaap and dei facts like the lxml engine does
+        self.facts = {}
         for tag in self.raw_data.find_all():
             tag.name = tag.name.lower()
+            if 'contextref' in tag.attrs and (tag.name.startswith('us-gaap:') or tag.name.startswith('dei:')):
+                self.facts.setdefault(tag.name, {})[tag.attrs['contextref']] = tag.text
+            if self.fact_builder is not None and 'contextref' in tag.attrs and 'unitref' in tag.attrs:
+                self.fact_builder.add(tag.name, tag.attrs['contextref'], tag.attrs['unitref'],
+                                      tag.attrs.get('decimals'), tag.text)
 
-        self._parse_YTD_xbrl()
+    def _find_period_end(self):
+        '''
+        the end of the period the file reports, used to order the files in load_many: the DEI document period
+        end date, or else the latest end date of the non dimensional contexts the data is taken from
+        (cover page and segment contexts might end later than the period of the report)
+        '''
+        tags = self._find_tags('dei:DocumentPeriodEndDate'.lower())
+        if len(tags) > 0:
+            try:
+                return datetime.strptime(tags[0][1].strip()[:10], '%Y-%m-%d')
+            except ValueError:
+                pass
+        selected = set(self.YTD_contexts) | set(self.Q4_contexts) | set(self.latestQ_context)
+        period_ends = [context.enddate or context.instant for context in self.context_table
+                       if context.id in selected and not context.has_dimensions]
+        return max(period_ends) if len(period_ends) > 0 else None
+
+    def _parse_xbrl_file(self, xbrl_path, kind):
+        '''
+        parse a single file from scratch, returns the results extracted from it
+        '''
+        self._reset_file_state()
+        self._read_xbrl_file(xbrl_path)
+        if kind == 'YTD':
+            self._parse_YTD_xbrl()
+        else:
+            self._parse_quarterly_xbrl()
+        period_end = self._find_period_end()
+        # the document itself is not needed anymore, only the extracted results are kept
+        self.raw_data = None
+        self.facts = None
+        self.contexts = None
+        self.fact_index = None
+        return {'data': self.file_data,
+                'fact_table': self.fact_builder.build(self.context_table) if self.fact_builder is not None else None,
+                'period_end': period_end,
+                'dei': {'document_end_date': self.document_end_date, 'currentFY': self.currentFY,
+                        'latest_stock_count': self.latest_stock_count},
+                'contexts': {'YTD': self.YTD_contexts, 'Q4': self.Q4_contexts, 'latestQ': self.latestQ_context}}
+
+    def _load_file_results(self, xbrl_path, kind):
+        if self.cache is None:
+            return self._parse_xbrl_file(xbrl_path, kind)
+        config_hash = get_config_hash(kind, self.use_dei, self.us_gaap_tag_names_list, self.alternative_tag_names,
+                                      self.collect_all_facts)
+        key = self.cache.get_key(xbrl_path, config_hash)
+        result = self.cache.get(key)
+        if result is None:
+            result = self._parse_xbrl_file(xbrl_path, kind)
+            self.cache.set(key, result)
+        elif result['fact_table'] is not None:
+            # the same content might have been cached under another path
+            result['fact_table'].filings = [xbrl_path]
+        return result
+
+    def _merge_file_results(self, result):
+        self.data_df = None
+        for tag_name, values in result['data'].items():
+            if tag_name not in self.data.keys():
+                self.data[tag_name] = {}
+            self.data[tag_name].update(values)
+        self.document_end_date = result['dei']['document_end_date']
+        self.currentFY = result['dei']['currentFY']
+        self.latest_stock_count = result['dei']['latest_stock_count']
+        self.YTD_contexts = result['contexts']['YTD']
+        self.Q4_contexts = result['contexts']['Q4']
+        self.latestQ_context = result['contexts']['latestQ']
+        if result['fact_table'] is not None:
+            self.fact_tables.append(result['fact_table'])
+
+    def _merge_YTD_results(self, result):
+        self._merge_file_results(result)
         if self.use_dei and self.currentFY not in self.data['NumberOfShares'].keys() and self.currentFY is not None:
             self.data['NumberOfShares'][self.currentFY] = self.latest_stock_count
-        self.data_df = pd.DataFrame(self.data)
+
+    def load_YTD_xbrl_file(self, xbrl_path):
+        '''
+        parse and load yearly reports (10-K or 20-F)
+        will update the data summary (the dataframe is rebuilt on the next get_data_df() call)
+        can add additional file on top of existing one
+        '''
+        self._merge_YTD_results(self._load_file_results(xbrl_path, 'YTD'))
 
     def load_10Q_xbrl_file(self, xbrl_path):
         '''
         parse and load quartely reports (10-Q), takes info of the last qurter described in the report
-        will update the data summary and dataframe
-        can add additional file on top of existing one, but notice that self.raw_data will get overwritten
+        will update the data summary (the dataframe is rebuilt on the next get_data_df() call)
+        can add additional file on top of existing one
         '''
-        with open(xbrl_path, 'r') as fh:
-            self.raw_data = BeautifulSoup(fh, "lxml")
-
-        for tag in self.raw_data.find_all():
-            tag.name = tag.name.lower()
+        self._merge_file_results(self._load_file_results(xbrl_path, '10Q'))
 
-        self._parse_quarterly_xbrl()
-        self.data_df = pd.DataFrame(self.data)
+    def iter_load(self, xbrl_paths, kind='YTD'):
+        '''
+        generator version of load_YTD_xbrl_file / load_10Q_xbrl_file over many files.
+        the files are parsed one by one, in the given order, and every file is released as soon as its
+        results were merged, so only one document is in memory at a time.
+        yields (xbrl_path, data extracted from that file)
+        '''
+        if kind not in ('YTD', '10Q'):
+            raise ValueError("kind should be 'YTD' or '10Q'")
+        for xbrl_path in xbrl_paths:
+            result = self._load_file_results(xbrl_path, kind)
+            if kind == 'YTD':
+                self._merge_YTD_results(result)
+            else:
+                self._merge_file_results(result)
+            yield xbrl_path, result['data']
+
+    def load_many(self, xbrl_paths, kind='YTD', workers=None):
+        '''
+        parse many files in a pool of processes and load all of them.
+        kind is 'YTD' (like load_YTD_xbrl_file) or '10Q' (like load_10Q_xbrl_file).
+        workers=None uses all the cpus for PARALLEL_MIN_FILES files or more, and parses fewer files in process.
+        the results are merged from the oldest filing to the newest one, so for a given period the
+        newest filing wins no matter in which order the files were given
+        '''
+        if kind not in ('YTD', '10Q'):
+            raise ValueError("kind should be 'YTD' or '10Q'")
+        xbrl_paths = list(xbrl_paths)
+        self._merge_ordered(xbrl_paths, self._load_many_results(xbrl_paths, kind, workers), kind)
+
+    def _load_many_results(self, xbrl_paths, kind, workers=None):
+        if workers is None:
+            workers = (os.cpu_count() or 1) if len(xbrl_paths) >= PARALLEL_MIN_FILES else 1
+        settings = (self.use_dei, self.extra_tags, self.engine, self.use_cache, self.cache_path,
+                    self.collect_all_facts)
+        if workers == 1 or len(xbrl_paths) <= 1:
+            return [self._load_file_results(xbrl_path, kind) for xbrl_path in xbrl_paths]
+        with ProcessPoolExecutor(max_workers=min(workers, len(xbrl_paths))) as pool:
+            return list(pool.map(_load_file_results_worker, xbrl_paths,
+                                 [kind] * len(xbrl_paths), [settings] * len(xbrl_paths)))
+
+    def _merge_ordered(self, xbrl_paths, results, kind):
+        ordered = sorted(zip(xbrl_paths, results),
+                         key=lambda item: (item[1]['period_end'] or datetime.min, item[0]))
+        for _, result in ordered:
+            if kind == 'YTD':
+                self._merge_YTD_results(result)
+            else:
+                self._merge_file_results(result)
+
+    def load_minimal(self, xbrl_paths, years=None, fields=None, workers=None):
+        '''
+        like load_many(xbrl_paths, kind='YTD'), but parses only the filings needed to cover the requested
+        fiscal years (default is all the years the filings cover): first the newest filings which together
+        cover the years (see tools/filing_planner.py), then older filings only for the years in which fields
+        reported by the company are still missing.
+        fields - the fields which should be complete (default is all of them)
+        returns the list of the parsed files
+        '''
+        headers = [filing_planner.read_filing_header(xbrl_path) for xbrl_path in xbrl_paths]
+        if years is None:
+            years = filing_planner.default_years(headers)
+        years = set(years)
+        parsed, results = [], []
+        wave = filing_planner.plan_filings(headers, years, fields)
+        while len(wave) > 0:
+            paths = [header.path for header in wave]
+            results += self._load_many_results(paths, 'YTD', workers)
+            parsed += wave
+            # the years in which a field which the company reports (in any parsed filing) is missing,
+            # by the number of years a filing reports for the field
+            found = {}
+            for result in results:
+                for tag_name, values in result['data'].items():
+                    if fields is None or tag_name in fields:
+                        found.setdefault(tag_name, set()).update(values.keys())
+            missing_years = {}
+            for tag_name, values in found.items():
+                if len(values) > 0:
+                    missing_years.setdefault(filing_planner.years_per_filing(tag_name), set()).update(
+                        years - values)
+            remaining = [header for header in headers if header not in parsed]
+            wave = []
+            for cover, cover_years in sorted(missing_years.items()):
+                wave += [header for header in filing_planner.plan_fallback(remaining, cover_years, cover)
+                         if header not in wave]
+        self._merge_ordered([header.path for header in parsed], results, 'YTD')
+        return [header.path for header in parsed]
 
     def get_data(self):
         return self.data
 
     def get_data_df(self):
+        if self.data_df is None:
+            self.data_df = pd.DataFrame(self.data)
         return self.data_df
+
+    def get_fact_table(self):
+        '''
+        all the numeric facts of the loaded files (needs collect_all_facts=True)
+        '''
+        return FactTable.concat(self.fact_tables)
+
+
+def _load_file_results_worker(xbrl_path, kind, settings):
+    # runs in a worker process of XBRL.load_many, returns only the compact results of the file
+    use_dei, extra_tags, engine, use_cache, cache_path, collect_all_facts = settings
+    xbrl = XBRL(use_dei=use_dei, extra_tags=extra_tags, engine=engine, use_cache=use_cache, cache_path=cache_path,
+                collect_all_facts=collect_all_facts)
+    return xbrl._load_file_results(xbrl_path, kind)